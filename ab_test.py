@@ -0,0 +1,149 @@
+import argparse
+import build
+import config_util as config_util
+import math
+import os
+import parallel_util
+import run_test
+import sys
+import tempfile
+from scipy import stats
+
+
+def paired_diff(score_a, score_b, objective: str) -> float:
+    """Relative improvement of B over A on one seed (positive = B is better)."""
+    diff = (score_b - score_a) / max(abs(score_a), abs(score_b), 1)
+    return diff if objective == "maximize" else -diff
+
+
+def wilcoxon_p(diffs) -> float:
+    if all(d == 0 for d in diffs):
+        return 1.0
+    try:
+        return float(stats.wilcoxon(diffs).pvalue)
+    except ValueError:
+        return 1.0
+
+
+def run_ab(config, sol_a, sol_b, seeds, alpha, min_seeds, check_every, jobs, pin=False):
+    """Run A and B on the same seeds in interleaved order and stop early once the paired test is significant.
+
+    The test is checked only every `check_every` pairs after `min_seeds`, and each
+    look uses alpha / (number of planned looks) so that early stopping does not
+    inflate the false positive rate.
+    """
+    objective = config["problem"]["objective"]
+    looks = max(1, math.ceil((len(seeds) - min_seeds) / check_every) + 1)
+    alpha_per_look = alpha / looks
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        out_a = os.path.join(out_dir, "a")
+        out_b = os.path.join(out_dir, "b")
+        os.makedirs(out_a)
+        os.makedirs(out_b)
+        cases_a = run_test.collect_cases(config, seeds, out_a)
+        cases_b = run_test.collect_cases(config, seeds, out_b)
+        func_a = run_test.make_case_func(config, sol_a)
+        func_b = run_test.make_case_func(config, sol_b)
+
+        pool = parallel_util.create_pool(jobs, pin=pin)
+        try:
+            # A, B を交互に投入し、結果はシード順に取り出す（検定に使うのは常に先頭からの連続したシード）
+            futures = []
+            for case_a, case_b in zip(cases_a, cases_b):
+                futures.append((pool.submit(func_a, *case_a), pool.submit(func_b, *case_b)))
+
+            diffs = []
+            win = lose = tie = 0
+            p_value = 1.0
+            for n, (fa, fb) in enumerate(futures, start=1):
+                ra, rb = fa.result(), fb.result()
+                d = paired_diff(ra["score"], rb["score"], objective)
+                diffs.append(d)
+                if d > 0:
+                    win += 1
+                elif d < 0:
+                    lose += 1
+                else:
+                    tie += 1
+                print(f"seed:{ra['case']}  A:{ra['score']:,d}  B:{rb['score']:,d}  ({d * 100.0:+.3f} %)")
+
+                if n >= min_seeds and ((n - min_seeds) % check_every == 0 or n == len(futures)):
+                    p_value = wilcoxon_p(diffs)
+                    print(f"[{n} seeds] p = {p_value:.4g} (threshold {alpha_per_look:.4g})")
+                    if p_value < alpha_per_look:
+                        break
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    if not diffs:
+        print("No results to display.")
+        return None
+
+    mean_diff = sum(diffs) / len(diffs) * 100.0
+    significant = p_value < alpha_per_look
+    print(f"----- A/B finished after {len(diffs)} / {len(seeds)} seeds -----")
+    print(f"B vs A: {mean_diff:+.3f} % (mean relative difference)")
+    print(f"Win / Lose / Tie (B vs A): {win} / {lose} / {tie}")
+    if significant:
+        print(f"Result: {'B' if mean_diff > 0 else 'A'} is better (p = {p_value:.4g})")
+    else:
+        print(f"Result: no significant difference (p = {p_value:.4g})")
+    return {
+        "seeds": len(diffs),
+        "mean_diff": mean_diff,
+        "p_value": p_value,
+        "significant": significant,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A/B comparison of two solution binaries with early stopping.")
+    parser.add_argument("baseline", help="Solution binary A (baseline).")
+    parser.add_argument(
+        "candidate",
+        nargs="?",
+        default=None,
+        help="Solution binary B (default: build the current cpp_file).",
+    )
+    parser.add_argument("--alpha", type=float, default=0.05, help="Overall significance level.")
+    parser.add_argument("--min-seeds", type=int, default=20, help="Seeds to run before the first test.")
+    parser.add_argument("--max-seeds", type=int, default=None, help="Seed budget (default: pretest_count).")
+    parser.add_argument("--check-every", type=int, default=10, help="Run the test every N seeds.")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=parallel_util.default_jobs(),
+        help="Number of parallel workers (default: physical cores - 1).",
+    )
+    parser.add_argument("--pin", action="store_true", help="Pin each worker to its own CPU.")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    if args.candidate is None:
+        sol_b = build.compile_program(config)
+    else:
+        sol_b = os.path.join(work_dir, args.candidate)
+    sol_a = os.path.join(work_dir, args.baseline)
+    for path in (sol_a, sol_b):
+        if not os.path.isfile(path):
+            print(f"Error: {path} was not found.", file=sys.stderr)
+            sys.exit(1)
+
+    max_seeds = args.max_seeds or config["problem"]["pretest_count"]
+    run_ab(
+        config,
+        sol_a,
+        sol_b,
+        range(max_seeds),
+        alpha=args.alpha,
+        min_seeds=min(args.min_seeds, max_seeds),
+        check_every=max(1, args.check_every),
+        jobs=max(1, args.jobs),
+        pin=args.pin,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import numpy as np
+
+BOOTSTRAP_CHUNK = 1 << 22  # 1 回にリサンプルする要素数の上限（メモリを抑える）
+
+
+def result_arrays(results, time_key="elapsed_time"):
+    """Convert run_test result dicts into NumPy arrays.
+
+    Returns a dict with seeds (int64), scores (int64), times / max_rss_kb
+    (float64) and ok (bool) aligned by index.
+    """
+    n = len(results)
+    seeds = np.fromiter((int(r["case"]) for r in results), dtype=np.int64, count=n)
+    scores = np.fromiter((r["score"] for r in results), dtype=np.int64, count=n)
+    times = np.fromiter((r[time_key] for r in results), dtype=np.float64, count=n)
+    mem = np.fromiter((r.get("max_rss_kb", 0.0) for r in results), dtype=np.float64, count=n)
+    ok = np.fromiter((r.get("status", "OK") == "OK" for r in results), dtype=bool, count=n)
+    return {"seeds": seeds, "scores": scores, "times": times, "max_rss_kb": mem, "ok": ok}
+
+
+def quantile(values, q):
+    """q-th percentile (q in [0, 100]) using the nearest-rank definition."""
+    values = np.asarray(values)
+    if values.size == 0:
+        return 0.0
+    return float(np.percentile(values, q, method="inverted_cdf"))
+
+
+def geometric_mean(values):
+    """Geometric mean of the positive entries (0.0 if there are none)."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[values > 0]
+    if values.size == 0:
+        return 0.0
+    return float(np.exp(np.log(values).mean()))
+
+
+def relative(scores, best, objective: str):
+    """AHC relative score in [0, 1] against the best known score, per element."""
+    scores = np.asarray(scores, dtype=np.float64)
+    best = np.asarray(best, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if objective == "maximize":
+            rel = np.where(best > 0, scores / best, 0.0)
+        else:
+            rel = np.where(scores > 0, best / scores, 0.0)
+    return np.clip(np.nan_to_num(rel), 0.0, 1.0)
+
+
+def bootstrap_ci(values, ci=0.95, n_boot=2000, seed=0):
+    """Percentile bootstrap confidence interval of the mean."""
+    values = np.asarray(values, dtype=np.float64)
+    n = values.size
+    if n == 0:
+        return 0.0, 0.0
+    if n == 1:
+        return float(values[0]), float(values[0])
+    rng = np.random.default_rng(seed)
+    means = np.empty(n_boot)
+    step = max(1, BOOTSTRAP_CHUNK // n)
+    for start in range(0, n_boot, step):
+        stop = min(n_boot, start + step)
+        idx = rng.integers(0, n, size=(stop - start, n))
+        means[start:stop] = values[idx].mean(axis=1)
+    alpha = (1.0 - ci) / 2.0 * 100.0
+    lo, hi = np.percentile(means, [alpha, 100.0 - alpha])
+    return float(lo), float(hi)
@@ -0,0 +1,284 @@
+import argparse
+import atexit
+import config_util as config_util
+import os
+import process_util
+import select
+import subprocess
+import sys
+import threading
+import time
+
+BATCH_ENV = "AHC_BATCH"  # この環境変数付きで起動されたソリューションはバッチプロトコルで動く
+HANDSHAKE = b"AHC_BATCH 1\n"  # 起動後にソリューションが最初に出力する行
+HANDSHAKE_TIMEOUT = 5.0  # 起動（初期化）を待つ最大時間（秒）
+READ_CHUNK = 1 << 16
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+class BatchError(Exception):
+    pass
+
+
+def _proc_cpu_ms(pid: int):
+    """user + sys CPU time (ms) of a running process from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            fields = f.read().rsplit(b")", 1)[1].split()
+    except OSError:
+        return None
+    # ")" の後ろの 12, 13 番目が utime, stime（クロックティック単位）
+    return (int(fields[11]) + int(fields[12])) * 1000.0 / CLK_TCK
+
+
+class BatchSolution:
+    """A long-lived solution process that solves cases sent over the batch protocol.
+
+    Protocol (all over the solution's stdin / stdout):
+      1. the runner starts the solution with AHC_BATCH=1 (and the HP_ params);
+         the solution prints "AHC_BATCH 1" once it is ready,
+      2. per case the runner writes "<bytes>\\n" followed by the input, and the
+         solution answers "<bytes>\\n" followed by the output,
+      3. the runner closes stdin and the solution exits.
+    """
+
+    def __init__(self, cmd, env=None, mem_mb=None, handshake_timeout=HANDSHAKE_TIMEOUT):
+        self.cmd = list(cmd)
+        self.env = dict(os.environ if env is None else env)
+        self.env[BATCH_ENV] = "1"
+        self.mem_mb = mem_mb
+        self.handshake_timeout = handshake_timeout
+        self.proc = None
+        self._buf = b""
+
+    def start(self) -> bool:
+        """Start the process; False if it does not answer the handshake (batch mode unsupported)."""
+        self.proc = subprocess.Popen(
+            process_util.limited_command(self.cmd, None, self.mem_mb),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=self.env,
+            start_new_session=True,
+        )
+        # 入力の書き込みも期限付きで行うため、stdin はノンブロッキングにする
+        os.set_blocking(self.proc.stdin.fileno(), False)
+        self._buf = b""
+        try:
+            line = self._read_line(time.monotonic() + self.handshake_timeout)
+        except BatchError:
+            line = None
+        if line != HANDSHAKE:
+            self.close()
+            return False
+        return True
+
+    def _fill(self, deadline: float) -> None:
+        fd = self.proc.stdout.fileno()
+        rest = deadline - time.monotonic()
+        if rest <= 0 or not select.select([fd], [], [], rest)[0]:
+            raise BatchError("TLE")
+        chunk = os.read(fd, READ_CHUNK)
+        if not chunk:
+            raise BatchError("RE")
+        self._buf += chunk
+
+    def _write_all(self, data: bytes, deadline: float) -> None:
+        """Write data to stdin by the deadline, reading any output that arrives meanwhile.
+
+        Raises BatchError("TLE") if the solution stops reading and the pipe stays full.
+        """
+        in_fd = self.proc.stdin.fileno()
+        out_fd = self.proc.stdout.fileno()
+        view = memoryview(data)
+        while view:
+            rest = deadline - time.monotonic()
+            if rest <= 0:
+                raise BatchError("TLE")
+            # 入力を読み終える前に出力し始めるソリューションでもパイプが詰まらないよう、出力も並行して受け取る
+            readable, writable, _ = select.select([out_fd], [in_fd], [], rest)
+            if readable:
+                chunk = os.read(out_fd, READ_CHUNK)
+                if not chunk:
+                    raise BatchError("RE")
+                self._buf += chunk
+            if writable:
+                try:
+                    view = view[os.write(in_fd, view):]
+                except BlockingIOError:
+                    pass
+
+    def _read_line(self, deadline: float) -> bytes:
+        while b"\n" not in self._buf:
+            self._fill(deadline)
+        line, self._buf = self._buf.split(b"\n", 1)
+        return line + b"\n"
+
+    def _read_exact(self, n: int, deadline: float) -> bytes:
+        while len(self._buf) < n:
+            self._fill(deadline)
+        data, self._buf = self._buf[:n], self._buf[n:]
+        return data
+
+    def solve(self, input_data: bytes, timeout_sec: float) -> dict:
+        """Solve one case. Returns status (OK / TLE / RE), output, elapsed_ms, cpu_ms and max_rss_kb.
+
+        On TLE / RE the process is killed; call start() again before the next case.
+        """
+        pid = self.proc.pid
+        cpu_before = _proc_cpu_ms(pid)
+        start_time = time.perf_counter()
+        deadline = time.monotonic() + timeout_sec
+        status = "OK"
+        output = b""
+        try:
+            self._write_all(b"%d\n" % len(input_data) + input_data, deadline)
+            header = self._read_line(deadline)
+            output = self._read_exact(int(header), deadline)
+        except (BatchError, BrokenPipeError, ValueError) as e:
+            status = str(e) if isinstance(e, BatchError) else "RE"
+        elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+        cpu_after = _proc_cpu_ms(pid)
+        cpu_ms = cpu_after - cpu_before if cpu_before is not None and cpu_after is not None else elapsed_ms
+        max_rss_kb = process_util.peak_rss_kb(pid)
+        if status != "OK":
+            self.close()
+        return {
+            "status": status,
+            "output": output,
+            "elapsed_ms": elapsed_ms,
+            "cpu_ms": cpu_ms,
+            "max_rss_kb": max_rss_kb,
+        }
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def close(self) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            pass
+        process_util.kill_group(self.proc.pid)
+        try:
+            self.proc.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            pass
+        self.proc.stdout.close()
+        self.proc = None
+
+
+# スレッド・コマンドごとに 1 つのバッチプロセスを使い回す（ワーカープールの各プロセスでは 1 つずつになる）
+_servers = {}
+_servers_lock = threading.Lock()
+_unsupported = set()
+
+
+def _close_all() -> None:
+    with _servers_lock:
+        servers = list(_servers.values())
+        _servers.clear()
+    for _, server in servers:
+        server.close()
+
+
+atexit.register(_close_all)
+
+
+def get_server(cmd, env=None, mem_mb=None, handshake_timeout=HANDSHAKE_TIMEOUT):
+    """Running BatchSolution of this thread for (cmd, env), or None if the solution does not support batch mode.
+
+    The previous process of the thread for the same cmd is closed when env differs (e.g. a new Optuna trial).
+    """
+    env_items = tuple(sorted((env or {}).items()))
+    key = (tuple(cmd), env_items, mem_mb)
+    if tuple(cmd) in _unsupported:
+        return None
+    ident = (threading.get_ident(), tuple(cmd))
+    with _servers_lock:
+        current = _servers.get(ident)
+    if current is not None and current[0] == key and current[1].alive():
+        return current[1]
+    if current is not None:
+        current[1].close()
+    server = BatchSolution(cmd, env=env, mem_mb=mem_mb, handshake_timeout=handshake_timeout)
+    if not server.start():
+        print(f"Warning: {cmd[0]} does not support the batch protocol; running one process per case.")
+        _unsupported.add(tuple(cmd))
+        with _servers_lock:
+            _servers.pop(ident, None)
+        return None
+    with _servers_lock:
+        _servers[ident] = (key, server)
+    return server
+
+
+def bench(solution_file: str, input_file: str, cases: int, timeout_sec: float) -> None:
+    """Per-case wall time of one process per case vs. the batch protocol on the same input."""
+    with open(input_file, "rb") as f:
+        input_data = f.read()
+
+    per_process = []
+    for _ in range(cases):
+        with open(input_file, "r") as fin:
+            run = process_util.run_limited([solution_file], stdin=fin, stdout=subprocess.DEVNULL, wall_sec=timeout_sec)
+        per_process.append(run["elapsed_ms"])
+
+    server = BatchSolution([solution_file])
+    start_time = time.perf_counter()
+    if not server.start():
+        print(f"Error: {solution_file} does not support the batch protocol ({BATCH_ENV}).", file=sys.stderr)
+        sys.exit(1)
+    startup_ms = (time.perf_counter() - start_time) * 1000.0
+    batch = []
+    try:
+        for _ in range(cases):
+            res = server.solve(input_data, timeout_sec)
+            if res["status"] != "OK":
+                print(f"Error: batch case failed ({res['status']}).", file=sys.stderr)
+                sys.exit(1)
+            batch.append(res["elapsed_ms"])
+    finally:
+        server.close()
+
+    per_process.sort()
+    batch.sort()
+    p_med = per_process[len(per_process) // 2]
+    b_med = batch[len(batch) // 2]
+    print(f"Cases: {cases}  (input: {os.path.basename(input_file)})")
+    print(f"One process per case: median {p_med:.3f} ms / case")
+    print(f"Batch protocol:       median {b_med:.3f} ms / case  (+ {startup_ms:.1f} ms startup once)")
+    print(f"Overhead saved:       {p_med - b_med:.3f} ms / case")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-case overhead of the batch protocol.")
+    parser.add_argument("--cases", type=int, default=200, help="Number of runs in each mode.")
+    parser.add_argument("--input", default=None, help="Input file (default: the first file in the input dir).")
+    parser.add_argument("--solution", default=None, help="Solution binary (default: sol_file).")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    solution_file = os.path.join(work_dir, args.solution or config["files"]["sol_file"])
+    input_file = args.input
+    if input_file is None:
+        input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
+        names = sorted(os.listdir(input_dir)) if os.path.isdir(input_dir) else []
+        if not names:
+            print(f"Error: no input files in {input_dir}.", file=sys.stderr)
+            sys.exit(1)
+        input_file = os.path.join(input_dir, names[0])
+    import run_test  # run_test がこのモジュールを import するため遅延 import
+    timeout_sec = config["problem"]["time_limit_ms"] / 1000.0 * run_test.TLE_FACTOR
+    bench(solution_file, input_file, max(1, args.cases), timeout_sec)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,224 @@
+import argparse
+import combiner
+import functools
+import hashlib
 import os
 import config_util as config_util
+import parallel_util
+import shlex
+import shutil
 import subprocess
 import sys
+import tempfile
 
-def compile_program(config):
+BUILD_CACHE_SIZE = 20  # キャッシュに残す成果物の数
+PGO_BINARY_NAME = "solution"  # gcda のファイル名は -o の出力先で決まるため、計装版と最終版で同じパスに出力する
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(compiler: str) -> str:
+    try:
+        res = subprocess.run([compiler, "--version"], capture_output=True, text=True, check=False)
+    except OSError:
+        return ""
+    return res.stdout
+
+
+def build_key(cpp_file_path: str, compiler: str, flags, index=None) -> str:
+    """Hash of the expanded sources (main + local includes), compiler flags and compiler version.
+
+    index: combiner.IncludeIndex to take the include graph and file hashes from
+    (unchanged files are not read again).
+    """
     work_dir = config_util.work_dir()
+    if index is None:
+        index = combiner.IncludeIndex()
+    h = hashlib.sha256()
+    h.update(compiler_version(compiler).encode())
+    h.update("\0".join([compiler] + list(flags)).encode())
+    for path in index.deps(cpp_file_path):
+        h.update(os.path.relpath(path, work_dir).encode())
+        h.update(index.digest(path).encode())
+    return h.hexdigest()
 
-    cpp_file_path = os.path.join(work_dir, config["files"]["cpp_file"])
-    sol_file_path = os.path.join(work_dir, config["files"]["sol_file"])
-    if not os.path.exists(cpp_file_path):
-        print(f"Error: {cpp_file_path} was not found.")
-        sys.exit(1)
 
-    cmd = ["g++", cpp_file_path]
-    cmd += ["-O2"] # コンパイルオプション
-    cmd += ["-o", sol_file_path]
-    print(f"Building: {config['files']['cpp_file']} -> {config['files']['sol_file']}")
+def build_options(config):
+    """(compiler, flags) from the [build] section of config.toml."""
+    compiler = config_util.get_option(config, "build", "compiler", "g++")
+    flags = shlex.split(config_util.get_option(config, "build", "flags", "-O2"))
+    return compiler, flags
+
+
+def cache_dir(config) -> str:
+    name = config_util.get_option(config, "paths", "build_cache_dir", "build_cache")
+    return os.path.join(config_util.work_dir(), name)
+
 
-    result = subprocess.run(cmd, capture_output=True, text=True, cwd=work_dir)
+def _store_artifact(src: str, dst: str) -> None:
+    tmp = f"{dst}.tmp{os.getpid()}"
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _prune_cache(directory: str, keep: int, dirs: bool = False) -> None:
+    """Remove all but the `keep` newest files (dirs=True: subdirectories) of directory."""
+    entries = [os.path.join(directory, e) for e in os.listdir(directory)]
+    # 成果物のディレクトリには pgo/ もあるため、消す対象は種類で分ける
+    entries = [e for e in entries if (os.path.isdir(e) if dirs else os.path.isfile(e))]
+    entries.sort(key=os.path.getmtime, reverse=True)
+    for path in entries[keep:]:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def _compile(compiler, cpp_file_path, flags, out_path):
+    cmd = [compiler, cpp_file_path]
+    cmd += flags  # コンパイルオプション（config.toml の [build] flags）
+    cmd += ["-o", out_path]
+    result = subprocess.run(cmd, capture_output=True, text=True, cwd=config_util.work_dir())
     if result.returncode != 0:
         print("Build failed.")
         print(result.stderr)
         sys.exit(1)
-    else:
-        print("Build succeeded.")
+
+
+def pgo_seeds(config):
+    return range(config_util.get_option(config, "build", "pgo_cases", 10))
+
+
+def _run_seeds(config, solution_file, seeds, jobs):
+    # run_test は build を import しているため遅延 import する
+    import run_test
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        cases = run_test.collect_cases(config, seeds, out_dir)
+        case_func = run_test.make_case_func(config, solution_file)
+        return sorted(run_test.run_cases(cases, case_func, jobs=jobs), key=lambda r: r["case"])
+
+
+def ensure_profile(config, cpp_file_path, compiler, flags, force=False, index=None) -> str:
+    """Return the PGO profile directory for the current sources, collecting it if needed.
+
+    Profiles are cached per source hash, so they are only recollected when the code changes.
+    """
+    pgo_root = os.path.join(cache_dir(config), "pgo")
+    profile_dir = os.path.join(pgo_root, build_key(cpp_file_path, compiler, flags, index=index))
+    # gcda は出力先のパスに応じてサブディレクトリ以下に作られることがある
+    has_profile = any(f.endswith(".gcda") for _, _, files in os.walk(profile_dir) for f in files)
+    if has_profile and not force:
+        os.utime(profile_dir)
+        return profile_dir
+
+    shutil.rmtree(profile_dir, ignore_errors=True)
+    os.makedirs(profile_dir)
+    gen_bin = os.path.join(profile_dir, PGO_BINARY_NAME)
+    print("Building instrumented binary for PGO ...")
+    _compile(compiler, cpp_file_path, flags + [f"-fprofile-generate={profile_dir}"], gen_bin)
+
+    seeds = pgo_seeds(config)
+    print(f"Collecting profile on {len(seeds)} cases ...")
+    results = _run_seeds(config, gen_bin, seeds, jobs=parallel_util.default_jobs())
+    if not results:
+        print("Error: no input files for PGO training.")
+        sys.exit(1)
+    _prune_cache(pgo_root, BUILD_CACHE_SIZE, dirs=True)
+    return profile_dir
+
+
+def build_artifact(config, force=False, pgo=False) -> str:
+    """Build the solution into the cache (unless already cached) and return the artifact path."""
+    cpp_file_path = os.path.join(config_util.work_dir(), config["files"]["cpp_file"])
+    if not os.path.exists(cpp_file_path):
+        print(f"Error: {cpp_file_path} was not found.")
+        sys.exit(1)
+
+    compiler, flags = build_options(config)
+    # インクルードグラフとファイルのハッシュは combiner と共有のインデックスから取る（変更のないファイルは読まない）
+    index = combiner.load_index(config)
+    out_path = None
+    if pgo:
+        profile_dir = ensure_profile(config, cpp_file_path, compiler, flags, force=force, index=index)
+        flags = flags + [f"-fprofile-use={profile_dir}", "-fprofile-correction", "-Wno-missing-profile"]
+        out_path = os.path.join(profile_dir, PGO_BINARY_NAME)
+
+    key = build_key(cpp_file_path, compiler, flags, index=index)
+    index.save()
+    artifact_dir = cache_dir(config)
+    artifact = os.path.join(artifact_dir, key)
+
+    # ソース・フラグ・コンパイラが同じならキャッシュ済みのバイナリを再利用
+    if not force and os.path.isfile(artifact):
+        os.utime(artifact)
+        print(f"Build skipped (cache hit): {config['files']['cpp_file']}{' (PGO)' if pgo else ''}")
+        return artifact
+
+    os.makedirs(artifact_dir, exist_ok=True)
+    if out_path is None:
+        out_path = f"{artifact}.build{os.getpid()}"
+    print(f"Building: {config['files']['cpp_file']} ({' '.join(flags)})")
+    _compile(compiler, cpp_file_path, flags, out_path)
+    print("Build succeeded.")
+
+    _store_artifact(out_path, artifact)
+    if not pgo:
+        os.remove(out_path)
+    _prune_cache(artifact_dir, BUILD_CACHE_SIZE)
+    return artifact
+
+
+def compile_program(config, force=False, pgo=None):
+    """Build (or fetch from cache) the solution and place it at sol_file.
+
+    pgo=None follows `pgo` in the [build] section of config.toml.
+    """
+    if pgo is None:
+        pgo = config_util.get_option(config, "build", "pgo", False)
+    artifact = build_artifact(config, force=force, pgo=pgo)
+    sol_file_path = os.path.join(config_util.work_dir(), config["files"]["sol_file"])
+    _store_artifact(artifact, sol_file_path)
+    return sol_file_path
+
+
+def report_pgo(config) -> None:
+    """Compare plain and PGO builds case by case on the PGO training cases."""
+    plain = build_artifact(config, pgo=False)
+    pgo = build_artifact(config, pgo=True)
+    time_key = "cpu_time" if config_util.get_option(config, "runner", "time_measure", "wall") == "cpu" else "elapsed_time"
+    seeds = pgo_seeds(config)
+    plain_results = _run_seeds(config, plain, seeds, jobs=1)
+    pgo_results = _run_seeds(config, pgo, seeds, jobs=1)
+
+    total_plain = total_pgo = 0.0
+    for a, b in zip(plain_results, pgo_results):
+        total_plain += a[time_key]
+        total_pgo += b[time_key]
+        speedup = a[time_key] / b[time_key] if b[time_key] > 0 else 0.0
+        print(f"seed:{a['case']}  plain:{a[time_key]:.2f} ms  pgo:{b[time_key]:.2f} ms  (x{speedup:.3f})")
+    if total_pgo > 0:
+        print(f"----- PGO speedup: x{total_plain / total_pgo:.3f} (total {total_plain:.2f} ms -> {total_pgo:.2f} ms) -----")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the solution.")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild even if a cached binary exists.",
+    )
+    parser.add_argument(
+        "--pgo",
+        action="store_true",
+        help="Build with profile-guided optimization and report the speedup over the plain build.",
+    )
+    args = parser.parse_args()
     config = config_util.load_config()
-    compile_program(config)
+    if args.pgo:
+        compile_program(config, force=args.force, pgo=True)
+        report_pgo(config)
+    else:
+        compile_program(config, force=args.force)
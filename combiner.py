@@ -1,8 +1,15 @@
+import argparse
+import hashlib
+import json
 import os
 import sys
 import re
 import config_util as config_util
-from typing import List, Set
+from typing import Dict, List, Optional, Set
+
+SYS_INCLUDE_RE = re.compile(r'^\s*#include\s+<(.+?)>\s*$')
+LOCAL_INCLUDE_RE = re.compile(r'^\s*#include\s+"(.+?)"\s*$')
+INDEX_VERSION = 2
 
 
 def read_file_content(file_path: str) -> str:
@@ -11,35 +18,124 @@ def read_file_content(file_path: str) -> str:
         return f.read()
 
 
-def inline_includes(
-        file_path: str,
-        stack: List[str],
-        added: Set[str]
-) -> List[str]:
+def _parse(file_path: str, content: str) -> list:
+    """Lines of a file as they are inlined: str for a copied line, {"i": path, "line": line} for a quoted include."""
     base_dir = os.path.dirname(file_path)
-    lines = read_file_content(file_path).splitlines()
-    output: List[str] = []
-
-    for line in lines:
+    tokens = []
+    for line in content.splitlines():
         stripped = line.strip()
         # Skip header guards
         if stripped.startswith(('#pragma once')):
             continue
 
         # Preserve only bits/stdc++.h system include
-        sys_match = re.match(r'^\s*#include\s+<(.+?)>\s*$', line)
+        sys_match = SYS_INCLUDE_RE.match(line)
         if sys_match:
             if sys_match.group(1) == 'bits/stdc++.h':
-                output.append(line)
+                tokens.append(line)
             continue
 
         # Handle local includes
-        inc_match = re.match(r'^\s*#include\s+"(.+?)"\s*$', line)
+        inc_match = LOCAL_INCLUDE_RE.match(line)
         if inc_match:
-            inc_name = inc_match.group(1)
-            inc_path = os.path.normpath(os.path.join(base_dir, inc_name))
+            tokens.append({"i": os.path.normpath(os.path.join(base_dir, inc_match.group(1))), "line": line})
+            continue
 
-            if inc_path in stack:
+        # Default: copy line as-is
+        tokens.append(line)
+    return tokens
+
+
+class IncludeIndex:
+    """Include graph of the local sources with per-file mtime, size and sha256.
+
+    A file is read and parsed again only when its mtime or size changed. With a
+    path, the index is kept on disk between runs and also remembers which
+    dependency hashes each generated output was built from.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        self.outputs: Dict[str, dict] = {}
+        self._checked: Set[str] = set()
+        self._dirty = False
+        if path and os.path.isfile(path):
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+                if data.get("version") == INDEX_VERSION:
+                    self.files = data.get("files", {})
+                    self.outputs = data.get("outputs", {})
+            except (OSError, ValueError):
+                # 壊れていれば作り直す
+                pass
+
+    def entry(self, file_path: str) -> dict:
+        """Index entry (mtime_ns, size, sha256, tokens) of one file, refreshed if the file changed."""
+        file_path = os.path.normpath(file_path)
+        cached = self.files.get(file_path)
+        # 同じプロセス内では 1 回だけ stat する
+        if cached is not None and file_path in self._checked:
+            return cached
+        st = os.stat(file_path)
+        if cached is None or cached["mtime_ns"] != st.st_mtime_ns or cached["size"] != st.st_size:
+            with open(file_path, 'rb') as f:
+                raw = f.read()
+            cached = {
+                "mtime_ns": st.st_mtime_ns,
+                "size": st.st_size,
+                "sha256": hashlib.sha256(raw).hexdigest(),
+                "tokens": _parse(file_path, raw.decode()),
+            }
+            self.files[file_path] = cached
+            self._dirty = True
+        self._checked.add(file_path)
+        return cached
+
+    def includes(self, file_path: str) -> List[str]:
+        """Local headers included directly by file_path (in order).
+
+        Quoted includes that are not files next to the including one (headers the
+        compiler finds through -I or the system path) are left to the compiler.
+        """
+        return [t["i"] for t in self.entry(file_path)["tokens"] if isinstance(t, dict) and os.path.isfile(t["i"])]
+
+    def deps(self, file_path: str) -> List[str]:
+        """file_path and every local header it pulls in (transitively), in the order they are inlined."""
+        order: List[str] = []
+        seen: Set[str] = set()
+
+        def _walk(path: str) -> None:
+            seen.add(path)
+            order.append(path)
+            for inc_path in self.includes(path):
+                if inc_path not in seen:
+                    _walk(inc_path)
+
+        _walk(os.path.normpath(file_path))
+        return order
+
+    def digest(self, file_path: str) -> str:
+        return self.entry(file_path)["sha256"]
+
+    def combine(self, file_path: str) -> List[str]:
+        """Lines of file_path with every local include inlined once."""
+        file_path = os.path.normpath(file_path)
+        return self._inline(file_path, [file_path], {file_path}, set())
+
+    def _inline(self, file_path: str, stack: List[str], on_stack: Set[str], added: Set[str]) -> List[str]:
+        output: List[str] = []
+        for token in self.entry(file_path)["tokens"]:
+            if not isinstance(token, dict):
+                output.append(token)
+                continue
+            inc_path = token["i"]
+            # ローカルに無いヘッダ（-I やシステムパスで見つかるもの）は行をそのまま残す
+            if not os.path.isfile(inc_path):
+                output.append(token["line"])
+                continue
+            if inc_path in on_stack:
                 print(f"Circular dependency detected: {' > '.join(stack + [inc_path])}")
                 sys.exit(1)
 
@@ -47,34 +143,104 @@ def inline_includes(
                 # Separator comment
                 output.append(f"// ── {os.path.basename(inc_path)} ──")
                 stack.append(inc_path)
-                inlined = inline_includes(inc_path, stack, added)
-                stack.pop()
+                on_stack.add(inc_path)
+                inlined = self._inline(inc_path, stack, on_stack, added)
+                on_stack.discard(stack.pop())
                 added.add(inc_path)
                 # Strip blank lines and append one blank line
                 for sub in inlined:
                     if sub.strip():
                         output.append(sub)
                 output.append('')
-            continue
+        return output
+
+    def is_current(self, src: str, dst: str) -> bool:
+        """True if dst was generated from src by this index and no dependency changed since."""
+        record = self.outputs.get(os.path.normpath(dst))
+        if record is None or record["src"] != os.path.normpath(src) or not os.path.isfile(dst):
+            return False
+        st = os.stat(dst)
+        if record["mtime_ns"] != st.st_mtime_ns or record["size"] != st.st_size:
+            return False
+        deps = self.deps(src)
+        return record["deps"] == {p: self.digest(p) for p in deps}
+
+    def regenerate(self, src: str, dst: str, force: bool = False) -> bool:
+        """Write the combined source of src to dst unless it is up to date. Returns True if written."""
+        if not force and self.is_current(src, dst):
+            return False
+        combined_lines = self.combine(src)
+        with open(dst, 'w') as f:
+            f.write('\n'.join(combined_lines))
+        st = os.stat(dst)
+        self.outputs[os.path.normpath(dst)] = {
+            "src": os.path.normpath(src),
+            "mtime_ns": st.st_mtime_ns,
+            "size": st.st_size,
+            "deps": {p: self.digest(p) for p in self.deps(src)},
+        }
+        self._dirty = True
+        return True
+
+    def save(self) -> None:
+        if not self.path or not self._dirty:
+            return
+        # 使われなくなったファイルの項目は消す
+        alive = set()
+        for record in self.outputs.values():
+            alive.update(record["deps"])
+        alive.update(self._checked)
+        self.files = {p: e for p, e in self.files.items() if p in alive}
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": INDEX_VERSION, "files": self.files, "outputs": self.outputs}, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def index_path(config) -> str:
+    return os.path.join(
+        config_util.work_dir(),
+        config_util.get_option(config, "files", "include_index_file", ".include_index.json"),
+    )
+
+
+def load_index(config) -> IncludeIndex:
+    """The persistent include index of the work directory."""
+    return IncludeIndex(index_path(config))
 
-        # Default: copy line as-is
-        output.append(line)
 
-    return output
+def inline_includes(
+        file_path: str,
+        stack: List[str],
+        added: Set[str]
+) -> List[str]:
+    index = IncludeIndex()
+    return index._inline(os.path.normpath(file_path), list(stack), set(stack), added)
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Inline local includes into a single source file.")
+    parser.add_argument('--force', action='store_true', help="Regenerate even if no dependency changed.")
+    parser.add_argument('--deps', action='store_true', help="Print the dependency list of cpp_file.")
+    args = parser.parse_args()
+
     config = config_util.load_config()
     work_dir = config_util.work_dir()
 
     src = os.path.join(work_dir, config['files']['cpp_file'])
     dst = os.path.join(work_dir, config['files']['combined_file'])
 
-    combined_lines = inline_includes(src, [src], set())
-    with open(dst, 'w') as f:
-        f.write('\n'.join(combined_lines))
-
-    print(f"Combined file generated: {dst}")
+    # 依存ファイル（mtime / ハッシュ）が前回の生成時から変わっていなければ書き直さない
+    index = load_index(config)
+    if index.regenerate(src, dst, force=args.force):
+        print(f"Combined file generated: {dst}")
+    else:
+        print(f"Combined file is up to date: {dst}")
+    index.save()
+    if args.deps:
+        for path in index.deps(src):
+            print(os.path.relpath(path, work_dir))
 
 
 if __name__ == '__main__':
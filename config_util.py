@@ -21,3 +21,8 @@ def config_path() -> str:
 
 def work_dir() -> str:
     return ROOT_DIR
+
+
+def get_option(config, section: str, key: str, default=None):
+    """Read config[section][key], falling back to default for older config.toml files."""
+    return config.get(section, {}).get(key, default)
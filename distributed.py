@@ -0,0 +1,310 @@
+import collections
+import hashlib
+import os
+import secrets
+import socket
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+HEARTBEAT_INTERVAL = 2.0  # ワーカーが生存通知を送る間隔（秒）
+HEARTBEAT_TIMEOUT = 10.0  # これ以上通知のないワーカーは落ちたとみなす（秒）
+FETCH_TIMEOUT = 1.0  # fetch が割り当てを待つ最大時間（秒）
+CONNECT_TIMEOUT = 30.0  # ワーカー起動時にコーディネータを待つ時間（秒）
+DEFAULT_CONCURRENT_TRIALS = 16  # --serve 時の既定の trial 並列数（全ワーカーのスロット数以上にする）
+AUTHKEY_ENV = "OPTUNA_DIST_AUTHKEY"  # コーディネータとワーカーで共有する認証キー（既定値は持たない）
+DEFAULT_HOST = "127.0.0.1"  # ホストを省略した時の待ち受け / 接続先
+WORKER_EXPOSED = ("register", "unregister", "heartbeat", "fetch", "report", "solution")
+CONNECTION_LOST = (ConnectionError, EOFError)
+
+
+class _BoardServer(BaseManager):
+    pass
+
+
+class _BoardClient(BaseManager):
+    pass
+
+
+_BoardClient.register("board")
+
+
+def parse_address(text: str):
+    """"HOST:PORT" or "PORT" -> (host, port).
+
+    A missing host means 127.0.0.1; other hosts can only reach the coordinator
+    when it is given explicitly (e.g. 0.0.0.0:PORT).
+    """
+    host, _, port = text.rpartition(":")
+    if not port.isdigit():
+        raise ValueError(f"Invalid address (expected HOST:PORT): {text}")
+    return host or DEFAULT_HOST, int(port)
+
+
+def generate_authkey() -> str:
+    """Random key for a coordinator started without AUTHKEY_ENV."""
+    return secrets.token_hex(16)
+
+
+class TrialHandle:
+    """Coordinator-side state of one trial evaluated by a worker."""
+
+    def __init__(self, key, params, seeds, env_prefix):
+        self.key = key
+        self.params = params
+        self.env_prefix = env_prefix
+        self.remaining = list(seeds)  # 未報告のシード（評価順を保つ）
+        self.results = {}
+        self.worker = None
+
+    def assignment(self) -> dict:
+        return {
+            "key": self.key,
+            "params": self.params,
+            "seeds": list(self.remaining),
+            "env_prefix": self.env_prefix,
+        }
+
+
+class TrialBoard:
+    """Pending trials, their assignments and worker heartbeats.
+
+    The objective threads of the coordinator call submit / result / close
+    directly; workers reach the methods in WORKER_EXPOSED through a proxy.
+    """
+
+    def __init__(self, sol_file: str):
+        self._sol_file = sol_file
+        self._cond = threading.Condition()
+        self._pending = collections.deque()
+        self._handles = {}
+        self._workers = {}  # worker_id -> 最後に生存通知を受けた時刻
+        self._next_key = 0
+        self._next_worker = 0
+        self._aborted = False
+
+    # ---- コーディネータ側 ----
+
+    def submit(self, params: dict, seeds, env_prefix: str) -> TrialHandle:
+        with self._cond:
+            handle = TrialHandle(self._next_key, params, seeds, env_prefix)
+            self._next_key += 1
+            self._handles[handle.key] = handle
+            if handle.remaining:
+                self._pending.append(handle)
+                self._cond.notify_all()
+            return handle
+
+    def result(self, handle: TrialHandle, seed: int):
+        """Block until the result of seed (what the worker's runner returned) has been reported."""
+        with self._cond:
+            while seed not in handle.results:
+                if self._aborted:
+                    raise RuntimeError("The coordinator was stopped.")
+                self._cond.wait(timeout=1.0)
+            return handle.results[seed]
+
+    def abort(self) -> None:
+        """Make every waiting result() raise (lets the trial threads end on Ctrl-C)."""
+        with self._cond:
+            self._aborted = True
+            self._cond.notify_all()
+
+    def close(self, handle: TrialHandle) -> None:
+        """Forget the trial (finished or pruned); its worker stops at the next report."""
+        with self._cond:
+            self._handles.pop(handle.key, None)
+            if handle in self._pending:
+                self._pending.remove(handle)
+
+    def reap(self, timeout: float):
+        """Drop workers without a recent heartbeat and requeue their trials with the unreported seeds.
+
+        Returns (dropped worker ids, requeued trial keys).
+        """
+        now = time.monotonic()
+        with self._cond:
+            dead = [w for w, t in self._workers.items() if now - t > timeout]
+            for w in dead:
+                del self._workers[w]
+            return dead, self._requeue(set(dead))
+
+    def _requeue(self, workers: set) -> list:
+        requeued = []
+        for handle in self._handles.values():
+            if handle.worker in workers:
+                handle.worker = None
+                self._pending.appendleft(handle)
+                requeued.append(handle.key)
+        if requeued:
+            self._cond.notify_all()
+        return requeued
+
+    # ---- ワーカー側（プロキシ経由） ----
+
+    def register(self, name: str) -> str:
+        with self._cond:
+            worker_id = f"{name}#{self._next_worker}"
+            self._next_worker += 1
+            self._workers[worker_id] = time.monotonic()
+        return worker_id
+
+    def unregister(self, worker_id: str) -> None:
+        with self._cond:
+            self._workers.pop(worker_id, None)
+            self._requeue({worker_id})
+
+    def heartbeat(self, worker_id: str) -> bool:
+        """False if the worker was already dropped (it must register again)."""
+        with self._cond:
+            if worker_id not in self._workers:
+                return False
+            self._workers[worker_id] = time.monotonic()
+            return True
+
+    def fetch(self, worker_id: str, timeout: float = FETCH_TIMEOUT):
+        """Next assignment dict for the worker, or None if nothing arrived within timeout."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while worker_id in self._workers:
+                if self._pending:
+                    handle = self._pending.popleft()
+                    handle.worker = worker_id
+                    return handle.assignment()
+                rest = deadline - time.monotonic()
+                if rest <= 0:
+                    break
+                self._cond.wait(rest)
+        return None
+
+    def report(self, worker_id: str, key: int, seed: int, result) -> bool:
+        """Store one instance result. False tells the worker to drop the trial (pruned, finished or reassigned)."""
+        with self._cond:
+            handle = self._handles.get(key)
+            if handle is None or handle.worker != worker_id:
+                return False
+            if seed in handle.remaining:
+                handle.remaining.remove(seed)
+            handle.results[seed] = result
+            self._cond.notify_all()
+            return True
+
+    def solution(self):
+        """(sha256, bytes) of the solution binary under study."""
+        with open(self._sol_file, "rb") as f:
+            data = f.read()
+        return hashlib.sha256(data).hexdigest(), data
+
+
+class Coordinator:
+    """Serve a TrialBoard to remote workers from background threads of this process."""
+
+    def __init__(self, address, authkey: bytes, sol_file: str):
+        self.board = TrialBoard(sol_file)
+        manager = _BoardServer(address=address, authkey=authkey)
+        manager.register("board", callable=lambda: self.board, exposed=WORKER_EXPOSED)
+        self._server = manager.get_server()
+        self.address = self._server.address
+        self._stop = threading.Event()
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        threading.Thread(target=self._monitor, daemon=True).start()
+
+    def _monitor(self) -> None:
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            dead, requeued = self.board.reap(HEARTBEAT_TIMEOUT)
+            for worker_id in dead:
+                print(f"Worker {worker_id} stopped responding.")
+            if requeued:
+                print(f"Requeued {len(requeued)} trial(s) of lost workers.")
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._server.stop_event.set()
+
+
+def connect(address, authkey: bytes, timeout: float = CONNECT_TIMEOUT):
+    """Proxy to the TrialBoard of a coordinator (retries until it is up)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        manager = _BoardClient(address=address, authkey=authkey)
+        try:
+            manager.connect()
+            return manager.board()
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1.0)
+
+
+def fetch_solution(board, cache_dir: str, name: str) -> str:
+    """Copy the coordinator's solution binary to cache_dir/<hash>/name (once per binary) and return its path."""
+    digest, data = board.solution()
+    path = os.path.join(cache_dir, digest[:16], name)
+    if not os.path.isfile(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o755)
+        os.replace(tmp_path, path)
+    return path
+
+
+def run_worker(board, slots: int, runner, name: str = None) -> int:
+    """Pull assignments with `slots` threads until the coordinator goes away.
+
+    runner(seed, params, env_prefix) runs one instance locally and returns its
+    result (e.g. (score, time_ms)), which is passed to the coordinator as is.
+    Returns the process exit code (1 if the runner failed).
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    state = {"worker_id": board.register(name), "failed": False}
+    stop = threading.Event()
+    print(f"Registered as {state['worker_id']} with {slots} slot(s).")
+
+    def _heartbeat():
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                if not board.heartbeat(state["worker_id"]):
+                    # 応答が遅れて落ちたとみなされた場合は登録し直す（実行中の trial は他へ回されている）
+                    state["worker_id"] = board.register(name)
+                    print(f"Re-registered as {state['worker_id']}.")
+            except CONNECTION_LOST:
+                stop.set()
+
+    def _slot():
+        while not stop.is_set():
+            try:
+                worker_id = state["worker_id"]
+                assignment = board.fetch(worker_id)
+                if assignment is None:
+                    continue
+                for seed in assignment["seeds"]:
+                    if stop.is_set():
+                        break
+                    result = runner(seed, assignment["params"], assignment["env_prefix"])
+                    if not board.report(worker_id, assignment["key"], seed, result):
+                        break
+            except CONNECTION_LOST:
+                stop.set()
+            except Exception as e:
+                # 入力ファイルが無いなど、このワーカーでは評価できない（割り当て中の trial は他のワーカーへ回す）
+                print(f"Error: {e}")
+                state["failed"] = True
+                stop.set()
+
+    threads = [threading.Thread(target=_heartbeat, daemon=True)]
+    threads += [threading.Thread(target=_slot, daemon=True) for _ in range(slots)]
+    for t in threads:
+        t.start()
+    try:
+        while not stop.wait(1.0):
+            pass
+    except KeyboardInterrupt:
+        stop.set()
+    try:
+        board.unregister(state["worker_id"])
+    except CONNECTION_LOST:
+        pass
+    print("Worker stopped.")
+    return 1 if state["failed"] else 0
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    score INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    time_ms REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache(last_used);
+"""
+
+EVICT_CHECK_INTERVAL = 256  # put の何回ごとにサイズを確認するか
+
+
+def cache_key(sol_hash: str, params: dict, seed: int) -> str:
+    """Content address of one evaluation: (solution binary, parameter vector, seed)."""
+    params_str = json.dumps(params, sort_keys=True)
+    return hashlib.sha256(f"{sol_hash}\0{params_str}\0{seed}".encode()).hexdigest()
+
+
+class EvalCache:
+    """Per-instance score cache in SQLite with size-bounded LRU eviction.
+
+    Safe to share between the trial threads of study.optimize(n_jobs=...).
+    """
+
+    def __init__(self, path: str, sol_hash: str, max_entries: int = 200000):
+        self.sol_hash = sol_hash
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._conn = sqlite3.connect(path, timeout=20.0, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        # 実行時間の列が無い古いキャッシュには列を追加する（既存のエントリの時間は不明として扱う）
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+        if "time_ms" not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE cache ADD COLUMN time_ms REAL")
+
+    def get_many(self, params: dict, seeds) -> dict:
+        """seed -> cached (score, time_ms) for the seeds already evaluated with these params (time_ms may be None)."""
+        keys = {cache_key(self.sol_hash, params, int(s)): int(s) for s in seeds}
+        if not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, score, time_ms FROM cache WHERE key IN ({placeholders})", list(keys)
+            ).fetchall()
+            if rows:
+                now = time.time()
+                with self._conn:
+                    self._conn.executemany(
+                        "UPDATE cache SET last_used = ? WHERE key = ?", [(now, k) for k, _, _ in rows]
+                    )
+        return {keys[k]: (score, time_ms) for k, score, time_ms in rows}
+
+    def put(self, params: dict, seed: int, score: int, time_ms=None) -> None:
+        key = cache_key(self.sol_hash, params, int(seed))
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, score, last_used, time_ms) VALUES (?, ?, ?, ?)",
+                    (key, int(score), time.time(), time_ms),
+                )
+            self._puts += 1
+            if self._puts % EVICT_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+
+    def close(self) -> None:
+        with self._lock:
+            self._evict()
+            self._conn.close()
@@ -0,0 +1,262 @@
+import analytics
+import argparse
+import config_util as config_util
+import hashlib
+import numpy as np
+import os
+import sqlite3
+import sys
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sol_hash TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_runs_hash ON runs(sol_hash, timestamp);
+CREATE TABLE IF NOT EXISTS results (
+    run_id INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    elapsed_time REAL,
+    cpu_time REAL,
+    max_rss_kb REAL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (run_id, seed)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_results_seed ON results(seed);
+CREATE TABLE IF NOT EXISTS best_scores (
+    seed INTEGER PRIMARY KEY,
+    score INTEGER NOT NULL,
+    run_id INTEGER NOT NULL
+);
+"""
+
+
+def file_hash(path: str) -> str:
+    """SHA-256 of a file (e.g. the solution binary)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def db_path(config) -> str:
+    name = config_util.get_option(config, "files", "history_db_file", "history.db")
+    return os.path.join(config_util.work_dir(), name)
+
+
+def connect(config) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path(config), timeout=20.0)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def record_run(conn, sol_hash: str, results, label=None) -> int:
+    """Store one run_test.py run and return its run_id.
+
+    results: dicts with case/score/elapsed_time/cpu_time/max_rss_kb/status.
+    """
+    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+    with conn:
+        cur = conn.execute(
+            "INSERT INTO runs (sol_hash, timestamp, label) VALUES (?, ?, ?)",
+            (sol_hash, timestamp, label),
+        )
+        run_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO results (run_id, seed, score, elapsed_time, cpu_time, max_rss_kb, status) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    run_id,
+                    int(r["case"]),
+                    r["score"],
+                    r.get("elapsed_time"),
+                    r.get("cpu_time"),
+                    r.get("max_rss_kb"),
+                    r["status"],
+                )
+                for r in results
+            ],
+        )
+    return run_id
+
+
+def resolve_run(conn, ref: str):
+    """Resolve a run reference: run id, 'latest', or a solution hash prefix (latest run of it)."""
+    if ref == "latest":
+        row = conn.execute("SELECT run_id FROM runs ORDER BY run_id DESC LIMIT 1").fetchone()
+    elif ref.isdigit():
+        row = conn.execute("SELECT run_id FROM runs WHERE run_id = ?", (int(ref),)).fetchone()
+    else:
+        row = conn.execute(
+            "SELECT run_id FROM runs WHERE sol_hash LIKE ? ORDER BY run_id DESC LIMIT 1",
+            (ref.lower() + "%",),
+        ).fetchone()
+    return row[0] if row else None
+
+
+def load_results(conn, run_id: int) -> dict:
+    """seed -> (score, elapsed_time, status)"""
+    rows = conn.execute(
+        "SELECT seed, score, elapsed_time, status FROM results WHERE run_id = ?",
+        (run_id,),
+    )
+    return {seed: (score, elapsed, status) for seed, score, elapsed, status in rows}
+
+
+def list_runs(conn, limit: int = 20):
+    return conn.execute(
+        "SELECT r.run_id, r.sol_hash, r.timestamp, r.label, COUNT(x.seed), AVG(x.score), MAX(x.elapsed_time) "
+        "FROM runs r LEFT JOIN results x ON x.run_id = r.run_id AND x.status = 'OK' "
+        "GROUP BY r.run_id ORDER BY r.run_id DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+
+
+def load_best_scores(conn) -> dict:
+    """seed -> (best known score, run_id)"""
+    rows = conn.execute("SELECT seed, score, run_id FROM best_scores")
+    return {seed: (score, run_id) for seed, score, run_id in rows}
+
+
+def update_best_scores(conn, run_id: int, results, objective: str) -> int:
+    """Merge the OK results of one run into the per-seed best table. Returns the number of updated seeds."""
+    op = ">" if objective == "maximize" else "<"
+    before = conn.total_changes
+    with conn:
+        conn.executemany(
+            "INSERT INTO best_scores (seed, score, run_id) VALUES (?, ?, ?) "
+            "ON CONFLICT(seed) DO UPDATE SET score = excluded.score, run_id = excluded.run_id "
+            f"WHERE excluded.score {op} best_scores.score",
+            [(int(r["case"]), r["score"], run_id) for r in results if r["status"] == "OK"],
+        )
+    return conn.total_changes - before
+
+
+def rebuild_best_scores(conn, objective: str) -> None:
+    """Recompute the best table from all stored runs (e.g. after changing objective)."""
+    agg = "MAX" if objective == "maximize" else "MIN"
+    with conn:
+        conn.execute("DELETE FROM best_scores")
+        conn.execute(
+            "INSERT INTO best_scores (seed, score, run_id) "
+            f"SELECT seed, {agg}(score), run_id FROM results WHERE status = 'OK' GROUP BY seed"
+        )
+
+
+def relative_report(best_scores: dict, results, objective: str, worst: int = 5) -> None:
+    """Print the relative score of a run against the best known scores (taken before this run)."""
+    if not results:
+        return
+    arrays = analytics.result_arrays(results)
+    seeds, scores, ok = arrays["seeds"], arrays["scores"], arrays["ok"]
+    known = np.fromiter((int(s) in best_scores for s in seeds), dtype=bool, count=len(seeds))
+    best = np.fromiter((best_scores.get(int(s), (0, None))[0] for s in seeds), dtype=np.float64, count=len(seeds))
+
+    # 失敗したケースは 0、初めてのシードは 1 として扱う
+    rel = np.where(known, analytics.relative(scores, best, objective), 1.0)
+    rel = np.where(ok, rel, 0.0)
+    sign = 1 if objective == "maximize" else -1
+    diff = (scores - best) * sign
+    cmp_mask = ok & known
+    win = int(np.count_nonzero(cmp_mask & (diff > 0)))
+    tie = int(np.count_nonzero(cmp_mask & (diff == 0)))
+    lose = int(np.count_nonzero(cmp_mask & (diff < 0))) + int(np.count_nonzero(~ok))
+    new = int(np.count_nonzero(ok & ~known))
+
+    print(f"----- Relative to best known ({len(best_scores)} seeds) -----")
+    print(f"Relative Score: {rel.mean() * 100.0:.3f} %")
+    print(f"Win / Lose / Tie: {win} / {lose} / {tie}" + (f"  (new seeds: {new})" if new else ""))
+    order = np.lexsort((seeds, rel))
+    regressions = [i for i in order[:worst] if rel[i] < 1.0]
+    if regressions:
+        print("Worst regressions:")
+        for i in regressions:
+            best_str = f"{int(best[i]):,d}" if known[i] else "-"
+            print(f"  seed:{seeds[i]:04d}  score:{scores[i]:,d}  best:{best_str}  ({rel[i] * 100.0:.2f} %)")
+
+
+def compare_runs(conn, run_a: int, run_b: int, objective: str) -> None:
+    a = load_results(conn, run_a)
+    b = load_results(conn, run_b)
+    seeds = sorted(set(a) & set(b))
+    if not seeds:
+        print("No common seeds.")
+        return
+
+    sign = 1 if objective == "maximize" else -1
+    win = lose = tie = 0
+    for seed in seeds:
+        sa, sb = a[seed][0], b[seed][0]
+        diff = (sb - sa) * sign
+        if diff > 0:
+            win += 1
+        elif diff < 0:
+            lose += 1
+        else:
+            tie += 1
+        print(f"seed:{seed:04d}  {sa:>14,d}  {sb:>14,d}  ({sb - sa:+,d})")
+
+    avg_a = sum(a[s][0] for s in seeds) / len(seeds)
+    avg_b = sum(b[s][0] for s in seeds) / len(seeds)
+    print(f"----- Run #{run_a} vs Run #{run_b} ({len(seeds)} common seeds) -----")
+    print(f"Average Score: {avg_a:.2f} -> {avg_b:.2f}")
+    print(f"Win / Lose / Tie (#{run_b} vs #{run_a}): {win} / {lose} / {tie}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query stored run_test.py results.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_list = sub.add_parser("list", help="List recent runs.")
+    p_list.add_argument("-n", type=int, default=20, help="Number of runs to show.")
+    p_show = sub.add_parser("show", help="Show per-seed results of a run.")
+    p_show.add_argument("run", help="Run id, 'latest' or solution hash prefix.")
+    p_cmp = sub.add_parser("compare", help="Compare two runs seed by seed.")
+    p_cmp.add_argument("run_a", help="Baseline run (id, 'latest' or hash prefix).")
+    p_cmp.add_argument("run_b", help="Run to compare (id, 'latest' or hash prefix).")
+    p_best = sub.add_parser("best", help="Show the per-seed best known scores.")
+    p_best.add_argument("--rebuild", action="store_true", help="Recompute the table from all stored runs.")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    conn = connect(config)
+
+    if args.command == "list":
+        for run_id, sol_hash, ts, label, n, avg, max_time in list_runs(conn, args.n):
+            avg_str = f"{avg:.2f}" if avg is not None else "-"
+            max_str = f"{max_time:.2f} ms" if max_time is not None else "-"
+            print(f"#{run_id:<5d} {ts}  {sol_hash[:12]}  cases:{n:<4d} avg:{avg_str}  max:{max_str}  {label or ''}")
+        return
+
+    if args.command == "best":
+        if args.rebuild:
+            rebuild_best_scores(conn, config["problem"]["objective"])
+        for seed, (score, run_id) in sorted(load_best_scores(conn).items()):
+            print(f"seed:{seed:04d}  best:{score:,d}  (run #{run_id})")
+        return
+
+    refs = [args.run] if args.command == "show" else [args.run_a, args.run_b]
+    run_ids = []
+    for ref in refs:
+        run_id = resolve_run(conn, ref)
+        if run_id is None:
+            print(f"Error: run '{ref}' was not found.", file=sys.stderr)
+            sys.exit(1)
+        run_ids.append(run_id)
+
+    if args.command == "show":
+        for seed, (score, elapsed, status) in sorted(load_results(conn, run_ids[0]).items()):
+            elapsed_str = f"{elapsed:.2f} ms" if elapsed is not None else "-"
+            print(f"seed:{seed:04d}  score:{score:,d}  ({elapsed_str})  {status}")
+    else:
+        compare_runs(conn, run_ids[0], run_ids[1], config["problem"]["objective"])
+
+
+if __name__ == "__main__":
+    main()
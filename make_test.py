@@ -1,51 +1,118 @@
+import argparse
+import concurrent.futures
 import config_util as config_util
+import math
+import parallel_util
+import signal
 import sys
 import os
+import shutil
 import subprocess
-import uuid
+import tempfile
 
-def main_with_params(L: int, R: int):
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDS_PER_JOB = 4  # ジョブあたりのシャード数（負荷の偏りをならす）
+TMP_PREFIX = "tmp_dir_"
+
+
+def _sweep_stale_tmp_dirs():
+    """Remove tmp_dir_<pid>_* directories left behind by make_test runs that no longer exist."""
+    # SIGKILL などで後始末できなかった一時ディレクトリを消す。作成したプロセスが生きていれば残す
+    for name in os.listdir(SCRIPT_DIR):
+        path = os.path.join(SCRIPT_DIR, name)
+        if not name.startswith(TMP_PREFIX) or not os.path.isdir(path):
+            continue
+        pid = name[len(TMP_PREFIX):].split("_", 1)[0]
+        if pid.isdigit():
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _generate_shard(gen, seeds, in_dir):
+    # 一時ディレクトリは with を抜ける時に必ず削除される（例外・中断時も）
+    with tempfile.TemporaryDirectory(prefix=f"{TMP_PREFIX}{os.getpid()}_", dir=SCRIPT_DIR) as tmp_dir:
+        seed_file = os.path.join(tmp_dir, "seeds.txt")
+        with open(seed_file, "w") as f:
+            for x in seeds:
+                f.write(f"{x}\n")
+
+        out_dir = os.path.join(tmp_dir, "out")
+        cmd = [gen, seed_file, f"--dir={out_dir}"]
+        subprocess.run(cmd, check=True, cwd=SCRIPT_DIR)
+
+        for i, seed in enumerate(seeds):
+            src_path = os.path.join(out_dir, f"{i:04d}.txt")
+            dst_path = os.path.join(in_dir, f"{seed:04d}.txt")
+            if os.path.exists(src_path):
+                os.replace(src_path, dst_path)
+    return len(seeds)
+
+
+def main_with_params(L: int, R: int, force: bool = False, jobs: int = None):
     if L > R:
         print("L must be less than or equal to R.")
         sys.exit(1)
 
     config = config_util.load_config()
-    SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
     work_dir = config_util.work_dir()
-
-    unique_id = uuid.uuid4().hex
-    tmp_dir = os.path.join(SCRIPT_DIR, f"tmp_dir_{unique_id}")
-    os.makedirs(tmp_dir, exist_ok=True)
-    tmp_file = os.path.join(SCRIPT_DIR, f"tmp_{unique_id}.txt")
-    with open(tmp_file, "w") as f:
-        for x in range(L, R):
-            f.write(f"{x}\n")
-
     gen = os.path.join(work_dir, config["files"]["gen_file"])
-    cmd = [gen, tmp_file, f"--dir={tmp_dir}"]
-    subprocess.run(cmd, check=True, cwd=SCRIPT_DIR)
-
     in_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
     os.makedirs(in_dir, exist_ok=True)
-    total_cases = R - L
-    for i in range(total_cases):
-        src_path = os.path.join(tmp_dir, f"{i:04d}.txt")
-        new_file_name = f"{L + i:04d}.txt"
-        dst_path = os.path.join(in_dir, new_file_name)
-        if os.path.exists(src_path):
-            os.rename(src_path, dst_path)
+    _sweep_stale_tmp_dirs()
+
+    # 既に存在するシードは --force がなければ作り直さない
+    seeds = [x for x in range(L, R) if force or not os.path.exists(os.path.join(in_dir, f"{x:04d}.txt"))]
+    skipped = (R - L) - len(seeds)
+    if not seeds:
+        print(f"All {R - L} cases already exist (use --force to regenerate).")
+        return
 
-    os.remove(tmp_file)
-    os.rmdir(tmp_dir)
+    if jobs is None:
+        jobs = parallel_util.default_jobs()
+    jobs = max(1, min(jobs, len(seeds)))
+    shard_size = math.ceil(len(seeds) / (jobs * SHARDS_PER_JOB))
+    shards = [seeds[i:i + shard_size] for i in range(0, len(seeds), shard_size)]
+
+    # gen は別プロセスなのでスレッドで並列に起動すれば十分
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(_generate_shard, gen, shard, in_dir) for shard in shards]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+        except BaseException:
+            for f in futures:
+                f.cancel()
+            raise
+
+    print(f"Generated {len(seeds)} cases in {len(shards)} shards" + (f" (skipped {skipped} existing)." if skipped else "."))
 
 
 def main():
-    if len(sys.argv) < 3:
-        print("Usage: python make_test.py <L> <R>")
-        sys.exit(1)
-    L = int(sys.argv[1])
-    R = int(sys.argv[2])
-    main_with_params(L, R)
+    parser = argparse.ArgumentParser(description="Generate test cases for seeds L <= seed < R.")
+    parser.add_argument("L", type=int, help="First seed (inclusive).")
+    parser.add_argument("R", type=int, help="Last seed (exclusive).")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate seeds that already exist.",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of parallel gen processes (default: physical cores - 1).",
+    )
+    args = parser.parse_args()
+
+    # SIGTERM でも一時ディレクトリの後始末が走るよう SystemExit に変換する
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(1))
+    main_with_params(args.L, args.R, force=args.force, jobs=args.jobs)
 
 
 if __name__ == "__main__":
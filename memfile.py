@@ -0,0 +1,29 @@
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def output_buffer():
+    """Yield (fd, path) of an anonymous in-memory file for a solution's output.
+
+    The fd can be used as a child's stdout, and path (/dev/fd/N) lets another
+    child such as vis read it when the fd is passed via pass_fds. On Linux the
+    buffer is a memfd, so nothing touches the filesystem. Elsewhere an unlinked
+    temporary file is used. The fd is closed on exit, so nothing can leak even
+    if the caller raises.
+    """
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("ahc-output")
+    else:
+        fd, name = tempfile.mkstemp(prefix="ahc-output-")
+        os.unlink(name)
+    try:
+        yield fd, f"/dev/fd/{fd}"
+    finally:
+        os.close(fd)
+
+
+def rewind(fd: int) -> None:
+    """Seek back to the start (needed where /dev/fd/N shares the offset, e.g. macOS)."""
+    os.lseek(fd, 0, os.SEEK_SET)
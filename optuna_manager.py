@@ -1,46 +1,87 @@
+import analytics
 import argparse
+import batch_server
 import build
 import json
+import memfile
 import numpy as np
 import os
 import optuna
 import config_util as config_util
+import distributed
+import eval_cache
+import history
+import parallel_util
+import param_report
+import process_util
+import run_test
+import scorer
 import shutil
+import signal
+import storage_util
 import sys
+import telemetry
 import time
-import uuid
 import warnings
 import re
-import subprocess
-from optuna.storages import RDBStorage
-from optuna.exceptions import ExperimentalWarning
-
-warnings.filterwarnings("ignore", category=ExperimentalWarning)
-
-
+from optuna.exceptions import ExperimentalWarning
+
+warnings.filterwarnings("ignore", category=ExperimentalWarning)
+
+EVAL_CACHE_FILE = "eval_cache.db"
+
+
 def suggest_parameters(trial, json_file):
-    with open(json_file, "r") as f:
-        data = json.load(f)
-
-    params = {}
-    # 整数パラメータ
-    for p in data.get("integer_params", []):
-        if p.get("used", False):
-            name = p["name"]
-            low, high = p["lower"], p["upper"]
-            params[name] = trial.suggest_int(name, low, high)
-
-    # 浮動小数点パラメータ
-    for p in data.get("float_params", []):
-        if p.get("used", False):
-            name = p["name"]
-            low, high = p["lower"], p["upper"]
-            log = p.get("log", False)
-            params[name] = trial.suggest_float(name, low, high, log=log)
-
+    with open(json_file, "r") as f:
+        data = json.load(f)
+
+    params = {}
+    # 整数パラメータ
+    for p in data.get("integer_params", []):
+        if p.get("used", False):
+            name = p["name"]
+            low, high = p["lower"], p["upper"]
+            params[name] = trial.suggest_int(name, low, high)
+
+    # 浮動小数点パラメータ
+    for p in data.get("float_params", []):
+        if p.get("used", False):
+            name = p["name"]
+            low, high = p["lower"], p["upper"]
+            log = p.get("log", False)
+            params[name] = trial.suggest_float(name, low, high, log=log)
+
+    # used: false のパラメータは探索せず、"value" を固定値として渡す（param_report.py で外したものなど）
+    for key in ("integer_params", "float_params"):
+        for p in data.get(key, []):
+            if not p.get("used", False) and "value" in p:
+                params[p["name"]] = p["value"]
+
     return params
 
 
+def _carry_over_unused(params_data: dict, root_json: str) -> list:
+    """Copy used: false (and the fixed value) of the root params.json into freshly extracted params. Returns the names."""
+    if not os.path.isfile(root_json):
+        return []
+    with open(root_json, "r", encoding="utf-8") as f:
+        root = json.load(f)
+    unused = {
+        p["name"]: p for key in ("integer_params", "float_params")
+        for p in root.get(key, []) if not p.get("used", True)
+    }
+    names = []
+    for key in ("integer_params", "float_params"):
+        for p in params_data.get(key, []):
+            prev = unused.get(p["name"])
+            if prev is not None:
+                p["used"] = False
+                if "value" in prev:
+                    p["value"] = prev["value"]
+                names.append(p["name"])
+    return names
+
+
 def _extract_hp_params_from_cpp(cpp_path: str) -> dict:
     """Parse HP_PARAM(type, name, def, low, high) from a C++ file.
 
@@ -89,131 +130,464 @@ def _extract_hp_params_from_cpp(cpp_path: str) -> dict:
 def _write_params_json(data: dict, path: str) -> None:
     with open(path, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
-
-
-def objective(trial, input_dir, output_dir, sol_file, vis_file, score_prefix, param_json_file, env_prefix: str = "HP_"):
+
+
+def run_instance(input_file, sol_file, case_scorer, params, env_prefix="HP_", limits=None, batch=False, time_measure="wall"):
+    """Run the solution on one instance with params injected via env.
+
+    Returns (score, time_ms): the score (-1 on failure) and the run time measured as
+    time_measure ("wall" or "cpu"), also for failed runs.
+    limits: keyword arguments of process_util.run_limited (wall_sec / cpu_sec / mem_mb).
+    batch: reuse one batch-protocol process per thread and params (see batch_server).
+    case_scorer: scorer.load_scorer(config); the output is passed to it without touching the disk.
+    """
+    # Optuna の各試行で得たパラメータを環境変数として子プロセスへ注入
+    # Run solution with params injected via environment variables
+    env = os.environ.copy()
+    for k, v in params.items():
+        env[f"{env_prefix}{k}"] = str(v)
+    limits = limits or {}
+    time_key = "cpu_ms" if time_measure == "cpu" else "elapsed_ms"
+    server = batch_server.get_server([sol_file], env=env, mem_mb=limits.get("mem_mb")) if batch else None
+    # 出力はディスクに書かずメモリ上のバッファ（memfd）経由で case_scorer に渡す
+    with memfile.output_buffer() as (out_fd, out_path):
+        if server is not None:
+            # パラメータは起動時の環境変数で渡るため、同じ trial の間だけプロセスを使い回す
+            with open(input_file, "rb") as fin:
+                run = server.solve(fin.read(), limits.get("wall_sec", 60.0))
+            if run["status"] == "OK":
+                with open(out_fd, "wb", closefd=False) as fout:
+                    fout.write(run["output"])
+        else:
+            with open(input_file, "r") as fin:
+                # 暴走・fork したソリューションもプロセスグループごと止める（TLE / MLE / RE は失敗扱い）
+                run = process_util.run_limited(
+                    [sol_file],
+                    stdin=fin,
+                    stdout=out_fd,
+                    env=env,
+                    **limits,
+                )
+        if run["status"] != "OK":
+            return -1, run[time_key]
+        memfile.rewind(out_fd)
+        # Score via the configured scorer (vis / vis_batch / python / ctypes)
+        score = case_scorer.score(input_file, out_path, pass_fds=(out_fd,))
+    return (-1 if score is None else score), run[time_key]
+
+
+def _fit_to_space(params: dict, json_file: str) -> dict:
+    """Keep only params that are used in params.json, clipped to their current bounds."""
+    with open(json_file, "r") as f:
+        data = json.load(f)
+    fitted = {}
+    for key, cast in (("integer_params", int), ("float_params", float)):
+        for p in data.get(key, []):
+            name = p["name"]
+            if p.get("used", False) and name in params:
+                fitted[name] = cast(min(max(params[name], p["lower"]), p["upper"]))
+    return fitted
+
+
+def instance_limits(config) -> dict:
+    """Wall / CPU / memory limits of one instance, with the same margins as run_test.py."""
+    limit_ms = config["problem"]["time_limit_ms"] * run_test.TLE_FACTOR * (1.0 + run_test.TLE_MARGIN_RATIO)
+    wall_sec = limit_ms / 1000.0
+    if config_util.get_option(config, "runner", "time_measure", "wall") == "cpu":
+        wall_sec *= run_test.CPU_MODE_WALL_FACTOR
+    return {
+        "wall_sec": wall_sec,
+        "cpu_sec": limit_ms / 1000.0,
+        "mem_mb": config_util.get_option(config, "runner", "memory_limit_mb", 0),
+    }
+
+
+def default_params(json_file: str) -> dict:
+    """Current "value" of every used parameter in params.json."""
+    with open(json_file, "r") as f:
+        data = json.load(f)
+    params = {}
+    for key in ("integer_params", "float_params"):
+        for p in data.get(key, []):
+            if p.get("used", False) and "value" in p:
+                params[p["name"]] = p["value"]
+    return _fit_to_space(params, json_file)
+
+
+def feasible(trial, runtime_limit_ms) -> bool:
+    """True if the trial's max run time is known and within runtime_limit_ms."""
+    max_time_ms = trial.user_attrs.get("max_time_ms")
+    return max_time_ms is not None and max_time_ms <= runtime_limit_ms
+
+
+def best_feasible_trial(study, direction: str, runtime_limit_ms):
+    """Completed trial with the best score among those within runtime_limit_ms (None if there is none)."""
+    trials = [
+        t for t in study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+        if t.values is not None and feasible(t, runtime_limit_ms)
+    ]
+    if not trials:
+        return None
+    pick = max if direction == "maximize" else min
+    return pick(trials, key=lambda t: t.values[0])
+
+
+def top_trial_params(prior_dir: str, db_file: str, direction: str, top_k: int, storage_kind: str = "sqlite") -> list:
+    """Params of the best completed trials of a previous study directory."""
+    prior = storage_util.load_existing_study(prior_dir, db_file, storage_kind)
+    if prior is None:
+        print(f"Error: no study storage was found for {prior_dir}.", file=sys.stderr)
+        sys.exit(1)
+    # 多目的の study ではスコア（1 つ目の目的）で並べ、TL の制約を満たさなかった trial は除く
+    trials = [
+        t for t in prior.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+        if t.values is not None and t.user_attrs.get("constraint", [0.0])[0] <= 0
+    ]
+    trials.sort(key=lambda t: t.values[0], reverse=(direction == "maximize"))
+    return [t.params for t in trials[:top_k]]
+
+
+def _record_runtime(trial, times, runtime_limit_ms, constrain: bool = True):
+    """Store max / p95 run time (ms) of the finished instances and the TL constraint in user_attrs.
+
+    Returns the max, or None if no instance time is known; such a trial is recorded
+    as violating the constraint, so it is never taken as within the TL.
+    constrain: also attach the constraint to the trial itself (Optuna 5 samplers and
+    study.best_trial then honor it); False in single mode.
+    """
+    times = times[~np.isnan(times)]
+    max_time_ms = float(times.max()) if times.size else None
+    trial.set_user_attr("max_time_ms", max_time_ms)
+    trial.set_user_attr("p95_time_ms", analytics.quantile(times, 95) if times.size else None)
+    if runtime_limit_ms is not None:
+        # 実行時間が分からない trial は制約違反（許容時間の 2 倍かかった扱い）にする
+        violation = max_time_ms - runtime_limit_ms if max_time_ms is not None else float(runtime_limit_ms)
+        trial.set_user_attr("constraint", [violation])
+        # Optuna 5 以降は trial に制約を直接設定する（それより前は sampler の constraints_func が user_attrs を読む）
+        if constrain and hasattr(trial, "set_constraint"):
+            trial.set_constraint("max_time", violation)
+    return max_time_ms
+
+
+def _constraints(trial) -> list:
+    """constraints_func of the samplers: max run time - allowed run time (feasible if <= 0)."""
+    return trial.user_attrs.get("constraint", [0.0])
+
+
+def objective(trial, input_dir, sol_file, case_scorer, param_json_file, env_prefix: str = "HP_", pool=None, intermediate: str = "instance", cache=None, board=None, events=None, verbose: bool = True, limits=None, batch: bool = False, seeds=None, time_measure: str = "wall", mode: str = "single", runtime_limit_ms=None):
+    """Average score over the instances (with mode="pareto", (average score, max run time)).
+
+    intermediate="instance" reports each instance score at step=instance id (for WilcoxonPruner);
+    intermediate="running_mean" reports the running mean at step=number of finished instances
+    (for SuccessiveHalvingPruner, i.e. multi-fidelity on the instance count).
+    cache: optional EvalCache; instances already evaluated with the same params are not rerun
+    (only successful runs, score > 0, are cached).
+    board: optional distributed.TrialBoard; the instances are run by a remote worker instead of pool.
+    events: optional telemetry.EventLog receiving trial / instance events.
+    limits: per-instance limits passed to run_instance (see instance_limits).
+    batch: run the instances over the batch protocol (one process per trial and worker thread).
+    seeds: instance ids to evaluate (default: 0..49).
+    time_measure: "wall" or "cpu" run time recorded per instance.
+    mode: "single" / "constrained" (one objective, pruned as usual) or "pareto" (score and max run
+    time as two objectives; multi-objective trials cannot be pruned).
+    A pruned trial raises optuna.TrialPruned; its partial average is kept in user_attrs["partial_avg"].
+    runtime_limit_ms: run time allowed by the TL safety margin; the trial's user_attrs get
+    max_time_ms / p95_time_ms and "constraint" = [max_time_ms - runtime_limit_ms] (feasible if <= 0).
+    With it, cached instances without a recorded run time are run again.
+    """
     params = suggest_parameters(trial, param_json_file)
+    trial_start = time.perf_counter()
+    if events is not None:
+        events.emit("trial_started", trial=trial.number, params=params)
+
+    all_test_numbers = np.arange(50) if seeds is None else np.asarray(seeds, dtype=np.int64)
 
     # 固定順序（Prunerの影響を安定化）: 環境変数 OPTUNA_OBJECTIVE_SEED で制御
+    # running_mean では途中の平均を trial 間で比べるため、既定で順序を固定する
     seed_env = os.environ.get("OPTUNA_OBJECTIVE_SEED")
+    if seed_env is None and intermediate == "running_mean":
+        seed_env = "0"
     if seed_env is not None:
         try:
             seed_val = int(seed_env)
         except Exception:
             seed_val = 0
         rng = np.random.default_rng(seed_val)
-        shuffled_ids = rng.permutation(np.arange(50))
+        shuffled_ids = rng.permutation(all_test_numbers)
     else:
-        all_test_numbers = np.arange(50)
         shuffled_ids = np.random.permutation(all_test_numbers)
-
-    results = []
-    for instance_id in shuffled_ids:
-        case_str = f"{instance_id:04d}"
-        input_file = os.path.join(input_dir, case_str + ".txt")
-        uid = uuid.uuid4().hex[:8]
-        output_file = os.path.join(output_dir, uid + ".txt")
-        if not os.path.exists(input_file):
-            print(f"Error: {input_file} was not found.")
-            exit(1)
-        
-        # Optuna の各試行で得たパラメータを環境変数として子プロセスへ注入
-        # Run solution with params injected via environment variables
-        env = os.environ.copy()
-        for k, v in params.items():
-            env[f"{env_prefix}{k}"] = str(v)
-        subprocess.run(
-            [sol_file],
-            stdin=open(input_file, "r"),
-            stdout=open(output_file, "w"),
-            stderr=subprocess.DEVNULL,
-            text=True,
-            check=False,
-            env=env,
-        )
-        # Score via vis
-        res = subprocess.run(
-            [vis_file, input_file, output_file],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            text=True,
-            check=False,
-        )
-        score = -1
-        for line in res.stdout.splitlines():
-            line = line.strip()
-            if line.startswith(score_prefix):
-                try:
-                    score = int(line.split("=")[-1].strip())
-                except Exception:
-                    score = -1
-                break
-        # cleanup temporary output
-        try:
-            if os.path.exists(output_file):
-                os.remove(output_file)
-        except Exception:
-            pass
-        if score <= 0:
-            results.append(-1)
-        else:
-            results.append(score)
-        trial.report(score, step=int(instance_id))
-        if trial.should_prune():
-            print(f"Trial pruned at instance {instance_id:04d} with intermediate avg score {sum(results) / len(results):.2f}")
-            return sum(results) / len(results)
-    avg_score = sum(results) / len(results)
-    print(f"Trial finished. Params={params}, avg_score={avg_score:.2f}")
-    return avg_score
-
-
-def main():
-    # コマンドライン引数をパース
-    parser = argparse.ArgumentParser(
-        description="Optuna study with parallel trials."
-    )
-    parser.add_argument(
-        "--dir",
-        help="Directory to store study results.",
-        dest="dir",
-        default=None
-    )
-    parser.add_argument(
-        "--last",
-        help="Use the most recent study directory under optuna work dir.",
-        action="store_true",
-        dest="last"
-    )
-    parser.add_argument(
-        "--zero",
-        help="Run with n_trials = 0 (skip optimization).",
-        action="store_true",
-        dest="zero"
-    )
-    args = parser.parse_args()
-
-    # 設定読み込み
+
+    tasks = []
+    for instance_id in shuffled_ids:
+        case_str = f"{instance_id:04d}"
+        input_file = os.path.join(input_dir, case_str + ".txt")
+        if not os.path.exists(input_file):
+            print(f"Error: {input_file} was not found.")
+            exit(1)
+        tasks.append((input_file, sol_file, case_scorer, params, env_prefix, limits, batch, time_measure))
+
+    # キャッシュ済み（同じバイナリ・同じパラメータ・同じシード）のインスタンスは再実行しない
+    cached = cache.get_many(params, shuffled_ids) if cache is not None else {}
+    # 失敗（TLE / RE / スコア 0 以下）は一時的な原因もあるため、キャッシュがあっても使わない（以前に保存されたものも含む）
+    cached = {seed: hit for seed, hit in cached.items() if hit[0] > 0}
+    # 実行時間の制約がある時は、実行時間の無いキャッシュ（time_ms の記録前のもの）は使わず実行し直す
+    if runtime_limit_ms is not None:
+        cached = {seed: hit for seed, hit in cached.items() if hit[1] is not None}
+
+    # pool があれば未評価のインスタンスを共有プールへ投入し、結果は shuffled_ids の順に受け取って report する
+    # board があれば未評価のインスタンスを 1 つの割り当てとしてワーカーへ渡し、スコアは 1 件ずつ受け取る
+    futures = {}
+    handle = None
+    if board is not None:
+        handle = board.submit(params, [int(i) for i in shuffled_ids if int(i) not in cached], env_prefix)
+    elif pool is not None:
+        futures = {
+            k: pool.submit(run_instance, *task)
+            for k, task in enumerate(tasks)
+            if int(shuffled_ids[k]) not in cached
+        }
+
+    results = np.empty(len(shuffled_ids))
+    # キャッシュに実行時間が無いインスタンス（古いキャッシュ）は NaN とし、集計から除く
+    times = np.full(len(shuffled_ids), np.nan)
+    try:
+        for k, instance_id in enumerate(shuffled_ids):
+            if int(instance_id) in cached:
+                score, time_ms = cached[int(instance_id)]
+            else:
+                if handle is not None:
+                    score, time_ms = board.result(handle, int(instance_id))
+                else:
+                    score, time_ms = futures[k].result() if k in futures else run_instance(*tasks[k])
+                if cache is not None and score > 0:
+                    cache.put(params, instance_id, score, time_ms)
+            results[k] = -1 if score <= 0 else score
+            if time_ms is not None:
+                times[k] = time_ms
+            if events is not None:
+                from_cache = int(instance_id) in cached
+                events.emit(
+                    "case_finished",
+                    trial=trial.number,
+                    case=f"{instance_id:04d}",
+                    score=score,
+                    cached=from_cache,
+                    worker=handle.worker if handle is not None and not from_cache else None,
+                )
+            if mode == "pareto":
+                continue
+            if intermediate == "running_mean":
+                trial.report(float(results[:k + 1].mean()), step=k + 1)
+            else:
+                trial.report(score, step=int(instance_id))
+            if trial.should_prune():
+                partial_avg = float(results[:k + 1].mean())
+                _record_runtime(trial, times[:k + 1], runtime_limit_ms, constrain=mode != "single")
+                if events is not None:
+                    elapsed_ms = (time.perf_counter() - trial_start) * 1000.0
+                    events.emit("trial_pruned", trial=trial.number, value=partial_avg, instances=k + 1, elapsed_ms=round(elapsed_ms, 3))
+                if verbose:
+                    print(f"Trial pruned at instance {instance_id:04d} with intermediate avg score {partial_avg:.2f}")
+                # 途中の平均は user_attrs にだけ残す。PRUNED の trial はベスト選択や param_report の対象外
+                trial.set_user_attr("partial_avg", partial_avg)
+                raise optuna.TrialPruned()
+    finally:
+        # 枝刈り時は未着手のインスタンスを取り消す
+        for f in futures.values():
+            f.cancel()
+        if handle is not None:
+            board.close(handle)
+    avg_score = float(results.mean())
+    max_time_ms = _record_runtime(trial, times, runtime_limit_ms, constrain=mode != "single")
+    if events is not None:
+        elapsed_ms = (time.perf_counter() - trial_start) * 1000.0
+        events.emit("trial_completed", trial=trial.number, value=avg_score, instances=len(results), elapsed_ms=round(elapsed_ms, 3), max_time_ms=None if max_time_ms is None else round(max_time_ms, 3))
+    if verbose:
+        time_str = "-" if max_time_ms is None else f"{max_time_ms:.1f} ms"
+        print(f"Trial finished. Params={params}, avg_score={avg_score:.2f}, max_time={time_str}")
+    if mode == "pareto":
+        # 実行時間が分からなければ NaN を返し、trial は失敗として扱われる
+        return avg_score, float("nan") if max_time_ms is None else max_time_ms
+    return avg_score
+
+
+def run_worker(config, address: str, authkey: bytes, slots: int, batch: bool = False) -> int:
+    """Serve as a worker: run the instances assigned by a --serve coordinator with the local inputs and scorer."""
+    work_dir = config_util.work_dir()
+    input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
+    case_scorer = scorer.load_scorer(config)
+    limits = instance_limits(config)
+    time_measure = config_util.get_option(config, "runner", "time_measure", "wall")
+    try:
+        board = distributed.connect(distributed.parse_address(address), authkey)
+    except Exception as e:
+        print(f"Error: cannot connect to {address}: {e}", file=sys.stderr)
+        return 1
+    # ソリューションはコーディネータのバイナリを取得して使う（全ホストで同じバイナリを評価する）
+    bin_dir = os.path.join(work_dir, config["paths"]["optuna_work_dir"], "worker_bin")
+    sol_file = distributed.fetch_solution(board, bin_dir, os.path.basename(config["files"]["sol_file"]))
+
+    def runner(seed, params, env_prefix):
+        input_file = os.path.join(input_dir, f"{seed:04d}.txt")
+        if not os.path.exists(input_file):
+            raise FileNotFoundError(f"{input_file} was not found.")
+        return run_instance(input_file, sol_file, case_scorer, params, env_prefix, limits=limits, batch=batch, time_measure=time_measure)
+
+    return distributed.run_worker(board, slots, runner)
+
+
+def main():
+    # コマンドライン引数をパース
+    parser = argparse.ArgumentParser(
+        description="Optuna study with parallel trials."
+    )
+    parser.add_argument(
+        "--dir",
+        help="Directory to store study results.",
+        dest="dir",
+        default=None
+    )
+    parser.add_argument(
+        "--last",
+        help="Use the most recent study directory under optuna work dir.",
+        action="store_true",
+        dest="last"
+    )
+    parser.add_argument(
+        "--zero",
+        help="Run with n_trials = 0 (skip optimization).",
+        action="store_true",
+        dest="zero"
+    )
+    parser.add_argument(
+        "--case-jobs",
+        help="Run the instances of each trial on a shared process pool of this size (default: OPTUNA_CASE_JOBS or 1 = sequential).",
+        type=int,
+        dest="case_jobs",
+        default=None
+    )
+    parser.add_argument(
+        "--warm-start",
+        help="Enqueue the best trials of a previous study directory as initial trials.",
+        dest="warm_start",
+        default=None
+    )
+    parser.add_argument(
+        "--warm-start-top",
+        help="Number of trials to take from --warm-start (default: 10).",
+        type=int,
+        dest="warm_start_top",
+        default=10
+    )
+    parser.add_argument(
+        "--warm-defaults",
+        help="Enqueue the current \"value\" defaults in params.json as an initial trial.",
+        action="store_true",
+        dest="warm_defaults"
+    )
+    parser.add_argument(
+        "--no-eval-cache",
+        help="Do not reuse per-instance scores of identical params (for deliberately stochastic solutions).",
+        action="store_false",
+        dest="eval_cache",
+        default=None
+    )
+    parser.add_argument(
+        "--storage",
+        help="Optuna storage: sqlite, journal, memory (flushed to SQLite periodically) or an RDB URL (default: [optuna] storage or sqlite).",
+        dest="storage",
+        default=None
+    )
+    parser.add_argument(
+        "--mode",
+        help="single: score only (default). constrained: score with max run time <= TL x tl_safety_ratio as a constraint. "
+             "pareto: score and max run time as two objectives (NSGA-II, no pruning).",
+        choices=["single", "constrained", "pareto"],
+        dest="mode",
+        default=None
+    )
+    parser.add_argument(
+        "--pruner",
+        help="wilcoxon: paired test per instance (default). halving: successive halving on the number of instances.",
+        choices=["wilcoxon", "halving"],
+        dest="pruner",
+        default="wilcoxon"
+    )
+    parser.add_argument(
+        "--serve",
+        help="Act as the coordinator: let workers connect on [HOST:]PORT (default host: 127.0.0.1) and run the instances of each trial.",
+        dest="serve",
+        default=None
+    )
+    parser.add_argument(
+        "--worker",
+        help="Act as a worker of the coordinator at HOST:PORT (no study is created on this host).",
+        dest="worker",
+        default=None
+    )
+    parser.add_argument(
+        "--worker-slots",
+        help="Number of trials a worker runs at the same time (default: physical cores - 1).",
+        type=int,
+        dest="worker_slots",
+        default=None
+    )
+    parser.add_argument(
+        "--seeds-file",
+        dest="seeds_file",
+        default=None,
+        help="Evaluate each trial on the seeds listed in this file (e.g. written by seed_select.py) instead of 0..49.",
+    )
+    parser.add_argument(
+        "--batch",
+        help="Run the instances of a trial on one persistent solution process (batch protocol, see batch_server.py).",
+        action="store_true",
+        dest="batch"
+    )
+    parser.add_argument(
+        "--events",
+        help="Append JSON-lines telemetry events (trial / instance started, finished, pruned) to this file.",
+        dest="events",
+        default=None
+    )
+    parser.add_argument(
+        "--progress",
+        help="Show a live progress line (trials/s, ETA, best value) instead of per-trial logs.",
+        action="store_true",
+        dest="progress"
+    )
+    args = parser.parse_args()
+
+    # 設定読み込み
     config = config_util.load_config()
     work_dir = config_util.work_dir()
     optuna_work_dir = os.path.join(work_dir, config["paths"]["optuna_work_dir"])
-
-    if not os.path.exists(optuna_work_dir):
-        os.makedirs(optuna_work_dir, exist_ok=True)
-
-    if args.last:
-        # optuna_work_dir 配下のサブディレクトリを辞書順でソートして最新を取得
-        subs = [d for d in os.listdir(optuna_work_dir) if os.path.isdir(os.path.join(optuna_work_dir, d))]
-        if not subs:
-            print(f"Error: no study directories found in {optuna_work_dir}", file=sys.stderr)
-            sys.exit(1)
-        lastest = sorted(subs)[-1]
-        study_dir = os.path.join(optuna_work_dir, lastest)
-    elif args.dir:
-        study_dir = args.dir
-    else:
-        timestamp = time.strftime("%Y%m%d_%H%M%S")
-        study_dir = os.path.join(optuna_work_dir, f"study_{timestamp}")
-
+
+    if not os.path.exists(optuna_work_dir):
+        os.makedirs(optuna_work_dir, exist_ok=True)
+
+    # 分散実行の認証キー（pickle でやり取りし、ワーカーはバイナリを受け取って実行するため既定値は使わない）
+    authkey = os.environ.get(distributed.AUTHKEY_ENV, "")
+
+    if args.worker:
+        if not authkey:
+            print(f"Error: set {distributed.AUTHKEY_ENV} to the key of the coordinator.", file=sys.stderr)
+            sys.exit(1)
+        slots = args.worker_slots or parallel_util.default_jobs()
+        sys.exit(run_worker(config, args.worker, authkey.encode(), max(1, slots), batch=args.batch))
+
+    if args.last:
+        # optuna_work_dir 配下の study ディレクトリ（params.json があるもの、worker_bin などは除く）を辞書順でソートして最新を取得
+        study_dir = param_report.latest_study_dir(optuna_work_dir, config["files"]["optuna_params_file"])
+        if study_dir is None:
+            print(f"Error: no study directories found in {optuna_work_dir}", file=sys.stderr)
+            sys.exit(1)
+    elif args.dir:
+        study_dir = args.dir
+    else:
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        study_dir = os.path.join(optuna_work_dir, f"study_{timestamp}")
+
     if not os.path.exists(study_dir):
         build.compile_program(config)
         cpp_file = os.path.join(work_dir, config["files"]["cpp_file"])
@@ -231,94 +605,224 @@ def main():
 
         # Generate params.json by extracting HP_PARAM macros from the copied cpp
         params_data = _extract_hp_params_from_cpp(cpp_copy)
+        # ルートの params.json で used: false にしたパラメータ（重要度が低いもの）は探索しない
+        carried = _carry_over_unused(params_data, os.path.join(work_dir, param_json_name))
+        if carried:
+            print(f"Fixed parameters (used: false in the root {param_json_name}): {', '.join(carried)}")
         param_json_file = os.path.join(study_dir, param_json_name)
         _write_params_json(params_data, param_json_file)
-
+
     input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
-    output_dir = study_dir
-    sol_file = os.path.join(study_dir, config["files"]["sol_file"])
-    vis_file = os.path.join(work_dir, config["files"]["vis_file"])
-    score_prefix = config["problem"]["score_prefix"]
+    sol_file = os.path.join(study_dir, config["files"]["sol_file"])
+    case_scorer = scorer.load_scorer(config)
+    # --seeds-file があれば各 trial をそのシード（seed_select.py で選んだ代表シードなど）で評価する
+    seeds = run_test.read_seeds_file(os.path.join(work_dir, args.seeds_file)) if args.seeds_file else None
     param_json_file = os.path.join(study_dir, config["files"]["optuna_params_file"])
-
-    # DBファイルパス（SQLite）
+
+    # DBファイル名（study ディレクトリごとのストレージでは study 名としても使う）
     optuna_db_file = config["files"]["optuna_db_file"]
-    db_path = os.path.join(study_dir, optuna_db_file)
-    db_url = f"sqlite:///{db_path}?cache=shared&mode=wal"
-
-    # WilcoxonPruner の設定
-    pruner = optuna.pruners.WilcoxonPruner(p_threshold=0.1)
-
-    # SQLite ストレージの作成
-    storage = RDBStorage(
-        url=db_url,
-        engine_kwargs={
-            "connect_args": {
-                # ロック待ちを最大20秒まで許容
-                "timeout": 20.0,
-            }
-        },
-    )
-
-    # Optuna study の作成
-    study = optuna.create_study(
-        study_name=optuna_db_file,
-        storage=storage,
-        load_if_exists=True,
-        direction=config["problem"]["objective"],
-        pruner=pruner,
-    )
-
+
+    # Pruner の設定
+    # halving: 5, 15, 45 インスタンス時点で下位 2/3 を打ち切る（少ない評価で悪い設定を落とす）
+    if args.pruner == "halving":
+        pruner = optuna.pruners.SuccessiveHalvingPruner(min_resource=5, reduction_factor=3)
+        intermediate = "running_mean"
+    else:
+        pruner = optuna.pruners.WilcoxonPruner(p_threshold=0.1)
+        intermediate = "instance"
+
+    # ストレージ: --storage > config の [optuna] storage > sqlite
+    # sqlite / journal / memory（メモリ上で実行し一定間隔で SQLite に書き戻す）/ RDB の URL
+    storage_kind = args.storage or config_util.get_option(config, "optuna", "storage", "sqlite")
+    flush_interval = config_util.get_option(config, "optuna", "flush_interval_sec", 10.0)
+
+    # 実行時間の扱い: --mode > config の [optuna] mode > single
+    # single: スコアのみ / constrained: 最大実行時間 <= TL × tl_safety_ratio を制約にする / pareto: スコアと最大実行時間の 2 目的
+    mode = args.mode or config_util.get_option(config, "optuna", "mode", "single")
+    if mode not in ("single", "constrained", "pareto"):
+        print(f"Error: unknown [optuna] mode \"{mode}\".", file=sys.stderr)
+        sys.exit(1)
+    time_measure = config_util.get_option(config, "runner", "time_measure", "wall")
+    runtime_limit_ms = config["problem"]["time_limit_ms"] * config_util.get_option(config, "optuna", "tl_safety_ratio", 0.9)
+    constraints_kwargs = {} if hasattr(optuna.trial.Trial, "set_constraint") else {"constraints_func": _constraints}
+    objective_kwargs = {"direction": config["problem"]["objective"]}
+    if mode == "constrained":
+        objective_kwargs["sampler"] = optuna.samplers.TPESampler(**constraints_kwargs)
+    elif mode == "pareto":
+        objective_kwargs = {
+            "directions": [config["problem"]["objective"], "minimize"],
+            "sampler": optuna.samplers.NSGAIISampler(**constraints_kwargs),
+        }
+
+    # Optuna study の作成
+    study, flusher = storage_util.open_study(
+        storage_kind,
+        study_dir,
+        optuna_db_file,
+        flush_interval=flush_interval,
+        pruner=pruner,
+        **objective_kwargs,
+    )
+
+    # ウォームスタート: 過去の study の上位 trial や現在のデフォルト値を最初に評価する
+    initial_params = []
+    if args.warm_defaults:
+        initial_params.append(default_params(param_json_file))
+    if args.warm_start:
+        prior = top_trial_params(
+            args.warm_start, optuna_db_file, config["problem"]["objective"], args.warm_start_top, storage_kind
+        )
+        initial_params += [_fit_to_space(p, param_json_file) for p in prior]
+    for p in initial_params:
+        study.enqueue_trial(p, skip_if_exists=True)
+    if initial_params:
+        print(f"Enqueued {len(initial_params)} warm-start trials.")
+
     n_trials = 500
     if args.zero:
         n_trials = 0
-
-    # 必要なら環境変数名にプレフィックスを付けたい場合はここで設定（例: "HP_")
-    # 既定はヘッダのデフォルトに合わせて HP_
+
+    # 必要なら環境変数名にプレフィックスを付けたい場合はここで設定（例: "HP_")
+    # 既定はヘッダのデフォルトに合わせて HP_
     env_prefix = os.environ.get("OPTUNA_PARAM_ENV_PREFIX", "HP_")
-
+    limits = instance_limits(config)
+
+    # ケース並列度: --case-jobs > 環境変数 OPTUNA_CASE_JOBS > 1（逐次）
+    case_jobs = args.case_jobs
+    if case_jobs is None:
+        try:
+            case_jobs = int(os.environ.get("OPTUNA_CASE_JOBS", "1"))
+        except Exception:
+            case_jobs = 1
+
     # 並列度は環境変数 OPTUNA_N_JOBS で上書き可能（デフォルト: -1 = 最大）
+    # ケースを共有プールで並列化する場合、CPU はプールが使い切るため試行スレッドは少数で十分
+    # --serve ではワーカーの応答を待つだけなので、全ワーカーのスロット数以上の trial を並列に走らせる
     n_jobs_env = os.environ.get("OPTUNA_N_JOBS")
+    if args.serve:
+        default_n_jobs = distributed.DEFAULT_CONCURRENT_TRIALS
+    else:
+        default_n_jobs = 2 if case_jobs > 1 else -1
     try:
-        n_jobs = int(n_jobs_env) if n_jobs_env is not None else -1
+        n_jobs = int(n_jobs_env) if n_jobs_env is not None else default_n_jobs
     except Exception:
-        n_jobs = -1
+        n_jobs = default_n_jobs
 
-    study.optimize(
-        lambda trial: objective(trial, input_dir, output_dir, sol_file, vis_file, score_prefix, param_json_file, env_prefix=env_prefix),
-        n_trials=n_trials,
-        n_jobs=n_jobs,
-    )
-
-    # 最終ベストパラメータで study_dir の JSON の "value" を更新し、ルートの params.json にも反映
-    best = study.best_params
-    best_score = study.best_value
-
-    def _apply_best_to_json(path):
-        with open(path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        for key in ("integer_params", "float_params"):
-            for p in data.get(key, []):
-                name = p.get("name")
-                if p.get("used") and name in best:
-                    p["value"] = best[name]
-        data["best_score"] = best_score
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
-
-    # study ディレクトリ側
-    _apply_best_to_json(param_json_file)
-    print(f"[Done] Updated {param_json_file} with best params: {best}")
-
-    # ルート側
+    # 評価キャッシュ: --no-eval-cache または config の [optuna] eval_cache = false で無効化
+    use_cache = args.eval_cache
+    if use_cache is None:
+        use_cache = config_util.get_option(config, "optuna", "eval_cache", True)
+    cache = None
+    if use_cache:
+        cache = eval_cache.EvalCache(
+            os.path.join(study_dir, EVAL_CACHE_FILE),
+            history.file_hash(sol_file),
+            max_entries=config_util.get_option(config, "optuna", "eval_cache_size", 200000),
+        )
+
+    coordinator = None
+    pool = None
+    if args.serve:
+        if not authkey:
+            # 未設定ならこの実行限りのキーを作り、ワーカーに渡せるよう表示する
+            authkey = distributed.generate_authkey()
+            print(f"{distributed.AUTHKEY_ENV} is not set; workers must use {distributed.AUTHKEY_ENV}={authkey}")
+        try:
+            coordinator = distributed.Coordinator(distributed.parse_address(args.serve), authkey.encode(), sol_file)
+        except (ValueError, OSError) as e:
+            print(f"Error: cannot serve on {args.serve}: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"Waiting for workers on {coordinator.address[0]}:{coordinator.address[1]} ({n_jobs} concurrent trials).")
+
+        # Ctrl-C 時、ワーカーの応答待ちで止まっている trial スレッドを終わらせる（optimize はスレッドの終了を待つため）
+        def _on_sigint(signum, frame):
+            coordinator.board.abort()
+            signal.default_int_handler(signum, frame)
+
+        signal.signal(signal.SIGINT, _on_sigint)
+    elif case_jobs > 1:
+        pool = parallel_util.create_pool(case_jobs)
+    board = coordinator.board if coordinator is not None else None
+
+    # テレメトリ: --events でイベントを JSON Lines に追記、--progress で進捗を 1 行表示（trial ごとのログは抑える）
+    view = telemetry.ProgressView(n_trials, unit="trials", direction=config["problem"]["objective"]) if args.progress else None
+    events = telemetry.create(args.events, view)
+    if view is not None:
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+    if events is not None:
+        events.emit("study_started", study_dir=study_dir, n_trials=n_trials, n_jobs=n_jobs)
+    try:
+        study.optimize(
+            lambda trial: objective(trial, input_dir, sol_file, case_scorer, param_json_file, env_prefix=env_prefix, pool=pool, intermediate=intermediate, cache=cache, board=board, events=events, verbose=view is None, limits=limits, batch=args.batch, seeds=seeds, time_measure=time_measure, mode=mode, runtime_limit_ms=runtime_limit_ms),
+            n_trials=n_trials,
+            n_jobs=n_jobs,
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if coordinator is not None:
+            coordinator.stop()
+        if cache is not None:
+            cache.close()
+        if flusher is not None:
+            flusher.stop()
+        if events is not None:
+            events.emit("study_finished", trials=len(study.get_trials(deepcopy=False)))
+            events.close()
+
+    # パラメータの重要度と周辺応答を study ディレクトリに書き出す（used: false の書き戻しは param_report.py で行う）
+    report = param_report.write_report(study, study_dir, config["problem"]["objective"])
+    if report is not None:
+        summary = ", ".join(f"{name} {value:.3f}" for name, value in report["importances"].items())
+        print(f"Parameter importance: {summary}  (details: {os.path.join(study_dir, param_report.REPORT_TXT)})")
+
+    if mode == "pareto":
+        front = sorted(study.best_trials, key=lambda t: t.values[1])
+        print(f"Pareto front ({len(front)} trials, score vs max time):")
+        for t in front:
+            print(f"  trial {t.number}: score {t.values[0]:.2f}  max {t.values[1]:.1f} ms  p95 {t.user_attrs.get('p95_time_ms', 0.0):.1f} ms  {t.params}")
+    # single はスコアだけで選ぶ。constrained / pareto は TL の安全マージン内（最大実行時間 <= TL × tl_safety_ratio）の trial のうちスコア最良のもの
+    if mode == "single":
+        try:
+            best_trial = study.best_trial
+        except ValueError:
+            print("Warning: no trial completed; params.json was not updated.")
+            return
+    else:
+        best_trial = best_feasible_trial(study, config["problem"]["objective"], runtime_limit_ms)
+        if best_trial is None:
+            print(f"Warning: no trial stayed under {runtime_limit_ms:.0f} ms (TL x tl_safety_ratio); params.json was not updated.")
+            return
+    best = best_trial.params
+    best_score = best_trial.values[0]
+
+    def _apply_best_to_json(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for key in ("integer_params", "float_params"):
+            for p in data.get(key, []):
+                name = p.get("name")
+                if p.get("used") and name in best:
+                    p["value"] = best[name]
+        data["best_score"] = best_score
+        data["best_max_time_ms"] = best_trial.user_attrs.get("max_time_ms")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+
+    # study ディレクトリ側
+    _apply_best_to_json(param_json_file)
+    print(f"[Done] Updated {param_json_file} with best params: {best}")
+
+    # ルート側
     root_param_json = os.path.join(work_dir, config["files"]["optuna_params_file"])
-    if os.path.isfile(root_param_json):
-        _apply_best_to_json(root_param_json)
-        print(f"[Done] Also updated {root_param_json} with best params.")
-
-    print("Best params:", study.best_params)
-    print("Best score:", study.best_value)
-
-
-if __name__ == "__main__":
-    main()
+    if os.path.isfile(root_param_json):
+        _apply_best_to_json(root_param_json)
+        print(f"[Done] Also updated {root_param_json} with best params.")
+
+    print("Best params:", best)
+    print("Best score:", best_score)
+    print(f"Max time: {best_trial.user_attrs.get('max_time_ms', 0.0):.1f} ms (p95 {best_trial.user_attrs.get('p95_time_ms', 0.0):.1f} ms, allowed {runtime_limit_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
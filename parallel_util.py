@@ -0,0 +1,100 @@
+import concurrent.futures
+import multiprocessing
+import os
+from typing import Dict, List, Tuple
+
+
+def _cpu_topology() -> Dict[int, Tuple[str, str]]:
+    """Map logical CPU id -> (physical id, core id) from /proc/cpuinfo.
+
+    Returns an empty dict when the topology is unavailable (non-Linux etc.).
+    """
+    topology: Dict[int, Tuple[str, str]] = {}
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            text = f.read()
+    except OSError:
+        return topology
+
+    for block in text.split("\n\n"):
+        fields = {}
+        for line in block.splitlines():
+            if ":" in line:
+                k, v = line.split(":", 1)
+                fields[k.strip()] = v.strip()
+        if "processor" not in fields or "core id" not in fields:
+            continue
+        try:
+            cpu = int(fields["processor"])
+        except ValueError:
+            continue
+        topology[cpu] = (fields.get("physical id", "0"), fields["core id"])
+    return topology
+
+
+def available_cpus() -> List[int]:
+    """Logical CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def physical_core_count() -> int:
+    """Number of physical cores usable by this process (logical count as fallback)."""
+    cpus = available_cpus()
+    topology = _cpu_topology()
+    cores = {topology[c] for c in cpus if c in topology}
+    if cores:
+        return len(cores)
+    return len(cpus)
+
+
+def default_jobs() -> int:
+    """Default worker count: physical cores minus one (at least 1)."""
+    return max(1, physical_core_count() - 1)
+
+
+def pin_order() -> List[int]:
+    """CPUs ordered so that each physical core is used once before any SMT sibling."""
+    topology = _cpu_topology()
+    first, siblings = [], []
+    seen = set()
+    for cpu in available_cpus():
+        key = topology.get(cpu, (None, cpu))
+        if key in seen:
+            siblings.append(cpu)
+        else:
+            seen.add(key)
+            first.append(cpu)
+    return first + siblings
+
+
+def _pin_worker(cpu_queue) -> None:
+    cpu = cpu_queue.get()
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError:
+        pass
+
+
+def create_pool(jobs: int, pin: bool = False) -> concurrent.futures.ProcessPoolExecutor:
+    """Create a process pool with `jobs` workers.
+
+    With pin=True each worker is bound to its own CPU (Linux only); child
+    processes started by a worker inherit the affinity, so the solution runs
+    on a dedicated core.
+    """
+    if not pin or not hasattr(os, "sched_setaffinity"):
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+    cpus = pin_order()
+    ctx = multiprocessing.get_context()
+    cpu_queue = ctx.Queue()
+    for i in range(jobs):
+        cpu_queue.put(cpus[i % len(cpus)])
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=ctx,
+        initializer=_pin_worker,
+        initargs=(cpu_queue,),
+    )
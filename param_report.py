@@ -0,0 +1,228 @@
+import argparse
+import config_util as config_util
+import json
+import numpy as np
+import optuna
+import os
+import storage_util
+import sys
+import warnings
+
+REPORT_JSON = "param_report.json"
+REPORT_TXT = "param_report.txt"
+MIN_TRIALS = 10  # 重要度・周辺応答を出すのに必要な完了 trial 数
+
+
+def latest_study_dir(optuna_work_dir: str, params_file: str):
+    """The newest study directory (with a params file) under optuna_work_dir, or None."""
+    if not os.path.isdir(optuna_work_dir):
+        return None
+    subs = [
+        d for d in os.listdir(optuna_work_dir)
+        if os.path.isfile(os.path.join(optuna_work_dir, d, params_file))
+    ]
+    return os.path.join(optuna_work_dir, sorted(subs)[-1]) if subs else None
+
+
+def completed_trials(study) -> list:
+    return [
+        t for t in study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,))
+        if t.values is not None
+    ]
+
+
+def importances(study, direction: str) -> dict:
+    """PED-ANOVA importance of each parameter for reaching a good score (the first objective), summing to 1.
+
+    PED-ANOVA needs no extra package (fANOVA requires scikit-learn) and looks at
+    low target values, so the score is negated for maximization.
+    """
+    sign = -1.0 if direction == "maximize" else 1.0
+    evaluator = optuna.importance.PedAnovaImportanceEvaluator()
+    with warnings.catch_warnings():
+        # target の向きは上で揃えているため、向きについての警告は出さない
+        warnings.simplefilter("ignore", UserWarning)
+        return dict(optuna.importance.get_param_importances(study, evaluator=evaluator, target=lambda t: sign * t.values[0]))
+
+
+def _edges(values: np.ndarray, bins: int) -> np.ndarray:
+    """Bin edges at the quantiles of values (one bin per value when there are few distinct values)."""
+    distinct = np.unique(values)
+    if len(distinct) <= bins:
+        mids = (distinct[1:] + distinct[:-1]) / 2.0
+        return np.concatenate([[distinct[0]], mids, [distinct[-1]]])
+    return np.unique(np.quantile(values, np.linspace(0.0, 1.0, bins + 1)))
+
+
+def _bin_index(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, max(0, len(edges) - 2))
+
+
+def marginal_1d(values: np.ndarray, scores: np.ndarray, bins: int) -> list:
+    """Per bin of one parameter: range, trial count, mean / std / best score."""
+    edges = _edges(values, bins)
+    idx = _bin_index(values, edges)
+    rows = []
+    for b in range(max(1, len(edges) - 1)):
+        s = scores[idx == b]
+        if s.size == 0:
+            continue
+        rows.append({
+            "lower": float(edges[b]),
+            "upper": float(edges[min(b + 1, len(edges) - 1)]),
+            "count": int(s.size),
+            "mean": float(s.mean()),
+            "std": float(s.std()),
+            "best": float(s.max()),
+        })
+    return rows
+
+
+def marginal_2d(x: np.ndarray, y: np.ndarray, scores: np.ndarray, bins: int) -> dict:
+    """Mean score on a (bins x bins) grid of two parameters (None where no trial fell)."""
+    x_edges, y_edges = _edges(x, bins), _edges(y, bins)
+    xi, yi = _bin_index(x, x_edges), _bin_index(y, y_edges)
+    shape = (max(1, len(x_edges) - 1), max(1, len(y_edges) - 1))
+    total = np.zeros(shape)
+    count = np.zeros(shape, dtype=np.int64)
+    np.add.at(total, (xi, yi), scores)
+    np.add.at(count, (xi, yi), 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+    return {
+        "x_edges": x_edges.tolist(),
+        "y_edges": y_edges.tolist(),
+        "mean": [[None if c == 0 else float(m) for m, c in zip(mr, cr)] for mr, cr in zip(mean, count)],
+        "count": count.tolist(),
+    }
+
+
+def build_report(study, direction: str, bins: int = 8, pair_bins: int = 4, top_pairs: int = 3) -> dict:
+    """Importances, 1-D marginals of every parameter and 2-D marginals of the pairs of the most important ones."""
+    trials = completed_trials(study)
+    # 最小化の問題でも「スコアが良い」が大きい値になるよう best は向きを揃える
+    sign = 1.0 if direction == "maximize" else -1.0
+    scores = np.array([t.values[0] for t in trials], dtype=np.float64)
+    imp = importances(study, direction)
+    names = list(imp)
+    report = {"trials": len(trials), "direction": direction, "importances": imp, "marginals": {}, "pairs": []}
+    for name in names:
+        mask = np.array([name in t.params for t in trials])
+        values = np.array([float(t.params[name]) for t in trials if name in t.params])
+        rows = marginal_1d(values, sign * scores[mask], bins)
+        for row in rows:
+            row["mean"] *= sign
+            row["best"] *= sign
+        report["marginals"][name] = rows
+    top = names[:max(0, top_pairs)]
+    for i in range(len(top)):
+        for j in range(i + 1, len(top)):
+            mask = np.array([top[i] in t.params and top[j] in t.params for t in trials])
+            x = np.array([float(t.params[top[i]]) for t, m in zip(trials, mask) if m])
+            y = np.array([float(t.params[top[j]]) for t, m in zip(trials, mask) if m])
+            grid = marginal_2d(x, y, scores[mask], pair_bins)
+            report["pairs"].append({"x": top[i], "y": top[j], **grid})
+    return report
+
+
+def format_report(report: dict) -> str:
+    lines = [f"Trials: {report['trials']} ({report['direction']})", "", "Importance (PED-ANOVA):"]
+    for name, value in report["importances"].items():
+        lines.append(f"  {name:<24s} {value:6.3f}  {'#' * int(round(value * 40))}")
+    for name, rows in report["marginals"].items():
+        lines.append("")
+        lines.append(f"[{name}]  mean score by range (trials)")
+        for row in rows:
+            lines.append(f"  {row['lower']:>12.6g} .. {row['upper']:<12.6g} {row['mean']:>16.2f}  ±{row['std']:<12.2f} ({row['count']})")
+    for pair in report["pairs"]:
+        lines.append("")
+        lines.append(f"[{pair['x']} (rows) x {pair['y']} (columns)]  mean score")
+        header = "".join(f"{e:>14.5g}" for e in pair["y_edges"][:-1])
+        lines.append(f"{'':>14s}{header}")
+        for lower, row in zip(pair["x_edges"], pair["mean"]):
+            cells = "".join(f"{'-':>14s}" if v is None else f"{v:>14.2f}" for v in row)
+            lines.append(f"{lower:>14.5g}{cells}")
+    return "\n".join(lines) + "\n"
+
+
+def write_report(study, study_dir: str, direction: str, **kwargs):
+    """Write param_report.json / .txt into study_dir. Returns the report (None if there are too few trials)."""
+    if len(completed_trials(study)) < MIN_TRIALS:
+        return None
+    report = build_report(study, direction, **kwargs)
+    with open(os.path.join(study_dir, REPORT_JSON), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    with open(os.path.join(study_dir, REPORT_TXT), "w", encoding="utf-8") as f:
+        f.write(format_report(report))
+    return report
+
+
+def disable_params(json_file: str, names) -> list:
+    """Set used: false for names in a params.json (their "value" is kept and passed as a fixed value). Returns the changed names."""
+    with open(json_file, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    changed = []
+    for key in ("integer_params", "float_params"):
+        for p in data.get(key, []):
+            if p.get("name") in names and p.get("used", False):
+                p["used"] = False
+                changed.append(p["name"])
+    with open(json_file, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parameter importance and marginal response report of an Optuna study.")
+    parser.add_argument("--dir", default=None, help="Study directory (default: the latest one under optuna_work).")
+    parser.add_argument("--bins", type=int, default=8, help="Bins per parameter in the 1-D marginals.")
+    parser.add_argument("--pair-bins", type=int, default=4, help="Bins per axis in the 2-D marginals.")
+    parser.add_argument("--top-pairs", type=int, default=3, help="2-D marginals for the pairs among this many top parameters.")
+    parser.add_argument(
+        "--disable-below",
+        type=float,
+        default=None,
+        help="Write back used: false for parameters with importance below this (study and root params.json).",
+    )
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    params_file = config["files"]["optuna_params_file"]
+    study_dir = args.dir or latest_study_dir(os.path.join(work_dir, config["paths"]["optuna_work_dir"]), params_file)
+    if study_dir is None or not os.path.isdir(study_dir):
+        print("Error: no study directory was found.", file=sys.stderr)
+        sys.exit(1)
+
+    db_file = config["files"]["optuna_db_file"]
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    storage_kind = config_util.get_option(config, "optuna", "storage", "sqlite")
+    study = storage_util.load_existing_study(study_dir, db_file, storage_kind)
+    if study is None:
+        print(f"Error: no study storage was found for {study_dir}.", file=sys.stderr)
+        sys.exit(1)
+    report = write_report(
+        study, study_dir, config["problem"]["objective"],
+        bins=max(1, args.bins), pair_bins=max(1, args.pair_bins), top_pairs=args.top_pairs,
+    )
+    if report is None:
+        print(f"Error: at least {MIN_TRIALS} completed trials are needed.", file=sys.stderr)
+        sys.exit(1)
+    print(format_report(report), end="")
+    print(f"Saved to {os.path.join(study_dir, REPORT_TXT)} and {REPORT_JSON}")
+
+    if args.disable_below is not None:
+        names = [name for name, value in report["importances"].items() if value < args.disable_below]
+        if not names:
+            print(f"No parameter has importance below {args.disable_below}.")
+            return
+        # study 側と、次の study の作成時に引き継がれるルート側の params.json を更新する
+        targets = [os.path.join(study_dir, params_file), os.path.join(work_dir, params_file)]
+        for path in targets:
+            if os.path.isfile(path):
+                changed = disable_params(path, set(names))
+                print(f"Set used: false in {path}: {', '.join(changed) or '(none)'}")
+
+
+if __name__ == "__main__":
+    main()
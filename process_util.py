@@ -0,0 +1,179 @@
+import math
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+MLE_NEAR_RATIO = 0.8  # メモリ上限の何割に達したプロセスの異常終了を MLE とみなすか
+RSS_SAMPLE_INTERVAL = 0.005  # 実行中の子プロセスのピーク RSS（VmHWM）を読む間隔（秒）
+
+
+def limited_command(cmd, cpu_sec, mem_mb) -> list:
+    """cmd wrapped in `sh -c 'ulimit ...; exec "$@"'` that sets RLIMIT_CPU / RLIMIT_AS (cmd itself if there is no limit).
+
+    The shell execs cmd in place, so the limits are in place before the solution
+    runs its first instruction, the pid stays the same and anything it forks
+    inherits them. Unlike preexec_fn this is safe in a multithreaded runner.
+    """
+    ulimits = []
+    # CPU: soft を超えると SIGXCPU、hard（+1 秒）で SIGKILL（soft > hard は設定できないため soft を先に下げる）
+    if cpu_sec is not None:
+        soft = max(1, math.ceil(cpu_sec))
+        ulimits += [f"ulimit -S -t {soft}", f"ulimit -H -t {soft + 1}"]
+    # ulimit -v は KB 単位（RLIMIT_AS）
+    if mem_mb:
+        ulimits.append(f"ulimit -v {int(mem_mb * 1024)}")
+    if not ulimits:
+        return list(cmd)
+    script = " && ".join(ulimits) + ' && exec "$@"'
+    return ["/bin/sh", "-c", script, "sh", *cmd]
+
+
+def peak_rss_kb(pid: int) -> float:
+    """Peak RSS (kB) of a running process so far (VmHWM), 0 where unavailable."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return float(line.split()[1])
+    except OSError:
+        pass
+    return 0.0
+
+
+def _self_max_rss_kb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss は Linux では KB、macOS では byte 単位
+    return usage.ru_maxrss / 1024 if sys.platform == "darwin" else usage.ru_maxrss
+
+
+def signal_name(sig: int) -> str:
+    try:
+        return signal.Signals(sig).name
+    except ValueError:
+        return f"SIG{sig}"
+
+
+def kill_group(pgid: int) -> None:
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def classify(timed_out: bool, returncode: int, cpu_ms: float, max_rss_kb: float, cpu_sec=None, mem_mb=None) -> str:
+    """OK / TLE / MLE / RE from how the process ended."""
+    sig = -returncode if returncode < 0 else None
+    if timed_out or sig == signal.SIGXCPU:
+        return "TLE"
+    if sig == signal.SIGKILL and cpu_sec is not None and cpu_ms >= cpu_sec * 1000.0:
+        # CPU 時間の hard limit による SIGKILL
+        return "TLE"
+    if mem_mb:
+        cap_kb = mem_mb * 1024.0
+        # RLIMIT_AS による確保失敗は bad_alloc（SIGABRT）や SIGSEGV として現れるため、上限付近での異常終了も MLE とする
+        if max_rss_kb > cap_kb or (returncode != 0 and max_rss_kb >= cap_kb * MLE_NEAR_RATIO):
+            return "MLE"
+    if returncode != 0:
+        return "RE"
+    return "OK"
+
+
+def run_limited(
+    cmd,
+    stdin=None,
+    stdout=None,
+    stderr=subprocess.DEVNULL,
+    env=None,
+    pass_fds=(),
+    wall_sec=None,
+    cpu_sec=None,
+    mem_mb=None,
+    on_stderr=None,
+):
+    """Run cmd in its own process group with wall / CPU / memory limits.
+
+    wall_sec: the whole group is SIGKILLed when it runs longer.
+    cpu_sec / mem_mb: RLIMIT_CPU / RLIMIT_AS of the process (inherited by its children),
+    set by the exec wrapper of limited_command.
+    on_stderr: if given, stderr is read line by line and each line is passed to it.
+    The group is killed after the process exits as well, so nothing it forked survives.
+
+    Returns a dict with status (OK / TLE / MLE / RE), returncode, signal (name
+    or None), elapsed_ms, cpu_ms and max_rss_kb.
+
+    max_rss_kb is the peak RSS of the process after exec. ru_maxrss of wait4 also
+    counts the runner's pages the child had before exec, so it is used only when it
+    exceeds the runner's own peak; otherwise the VmHWM sampled while the process
+    runs is used (a lower bound, 0 where /proc is unavailable).
+    """
+    start_time = time.perf_counter()
+    proc = subprocess.Popen(
+        limited_command(cmd, cpu_sec, mem_mb),
+        stdin=stdin,
+        stdout=stdout,
+        stderr=subprocess.PIPE if on_stderr is not None else stderr,
+        env=env,
+        pass_fds=pass_fds,
+        text=on_stderr is not None,
+        errors="replace" if on_stderr is not None else None,
+        start_new_session=True,
+    )
+    # Popen は exec の完了後に戻るため、この時点のランナーのピーク RSS が exec 前の子の RSS の上限になる
+    baseline_kb = _self_max_rss_kb()
+    killed = threading.Event()
+    exited = threading.Event()
+    sampled_kb = [peak_rss_kb(proc.pid)]
+
+    def _kill():
+        killed.set()
+        kill_group(proc.pid)
+
+    def _sample():
+        while not exited.wait(RSS_SAMPLE_INTERVAL):
+            sampled_kb.append(peak_rss_kb(proc.pid))
+
+    timer = None
+    sampler = None
+    try:
+        if wall_sec is not None:
+            timer = threading.Timer(wall_sec, _kill)
+            timer.start()
+        if sampled_kb[0] > 0:
+            sampler = threading.Thread(target=_sample, daemon=True)
+            sampler.start()
+        if on_stderr is not None:
+            for line in proc.stderr:
+                on_stderr(line)
+        _, status, rusage = os.wait4(proc.pid, 0)
+    finally:
+        exited.set()
+        if timer is not None:
+            timer.cancel()
+        if on_stderr is not None:
+            proc.stderr.close()
+        # 子プロセスが fork したものが残っていれば止める
+        kill_group(proc.pid)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000.0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if sampler is not None:
+        sampler.join()
+
+    cpu_ms = (rusage.ru_utime + rusage.ru_stime) * 1000.0
+    # ru_maxrss は Linux では KB、macOS では byte 単位
+    # exec 前の（ランナーから引き継いだ）RSS も含むため、ランナーのピークを超えた時だけ子のピークとみなす
+    ru_maxrss_kb = rusage.ru_maxrss / 1024 if sys.platform == "darwin" else rusage.ru_maxrss
+    max_rss_kb = float(ru_maxrss_kb) if ru_maxrss_kb > baseline_kb else max(sampled_kb)
+    sig = -proc.returncode if proc.returncode < 0 else None
+    return {
+        "status": classify(killed.is_set(), proc.returncode, cpu_ms, max_rss_kb, cpu_sec=cpu_sec, mem_mb=mem_mb),
+        "returncode": proc.returncode,
+        "signal": signal_name(sig) if sig else None,
+        "elapsed_ms": elapsed_ms,
+        "cpu_ms": cpu_ms,
+        "max_rss_kb": max_rss_kb,
+    }
@@ -1,12 +1,23 @@
+import analytics
+import argparse
+import batch_server
 import build
+import concurrent.futures
 import config_util as config_util
-import subprocess
-import time
+import functools
+import history
+import parallel_util
+import process_util
+import scorer
+import sys
+import telemetry
+import tempfile
 import os
 
 
 TLE_FACTOR = 2.5
 TLE_MARGIN_RATIO = 0.05  # タイムアウト判定用の緩衝比率（5%余裕）
+CPU_MODE_WALL_FACTOR = 2.0  # time_measure = "cpu" の時の wall 打ち切り倍率
 
 
 def failure_score(objective: str) -> int:
@@ -17,153 +28,483 @@ def failure_score(objective: str) -> int:
     raise ValueError(f"Unsupported objective: {objective}")
 
 
+def _case_result(case_str, run, fail_score, timeout_limit_ms, time_measure):
+    """Result dict of a case from process_util.run_limited output (score still unset)."""
+    measured_ms = run["cpu_ms"] if time_measure == "cpu" else run["elapsed_ms"]
+    exit_status = run["status"]
+    if exit_status == "OK" and measured_ms > timeout_limit_ms:
+        exit_status = "TLE"
+    return {
+        "case": case_str,
+        "score": fail_score,
+        "elapsed_time": run["elapsed_ms"],
+        "cpu_time": run["cpu_ms"],
+        "max_rss_kb": run["max_rss_kb"],
+        "tle": exit_status == "TLE",
+        "exit_status": exit_status,
+        "signal": run["signal"],
+    }
+
+
 def run_test_case(
     case_str,
     input_file,
     output_file,
     solution_file,
-    vis_file,
-    score_prefix,
+    case_scorer,
     fail_score,
     tle_limit_ms,
     tle_margin_ratio,
+    time_measure="wall",
+    mem_limit_mb=0,
 ):
     cmd_cpp = [solution_file]
 
-    start_time = time.perf_counter()
     timeout_limit_ms = tle_limit_ms * (1.0 + tle_margin_ratio)
     timeout_sec = timeout_limit_ms / 1000.0
+    if time_measure == "cpu":
+        # CPU 時間で判定する場合、wall の打ち切りは暴走対策として緩めにかける
+        timeout_sec *= CPU_MODE_WALL_FACTOR
+    # 別プロセスグループで起動し、wall / CPU / メモリの上限を超えたらグループごと止める
+    with open(input_file, "r") as fin, open(output_file, "w") as fout:
+        run = process_util.run_limited(
+            cmd_cpp,
+            stdin=fin,
+            stdout=fout,
+            wall_sec=timeout_sec,
+            cpu_sec=timeout_limit_ms / 1000.0,
+            mem_mb=mem_limit_mb,
+        )
+    result = _case_result(case_str, run, fail_score, timeout_limit_ms, time_measure)
+    if result["exit_status"] != "OK":
+        return result
+
+    score = case_scorer.score(input_file, output_file)
+    result["score"] = fail_score if score is None else score
+    return result
+
+
+def run_batch_case(
+    case_str,
+    input_file,
+    output_file,
+    solution_file,
+    case_scorer,
+    fail_score,
+    tle_limit_ms,
+    tle_margin_ratio,
+    time_measure="wall",
+    mem_limit_mb=0,
+):
+    """run_test_case on a persistent solution process speaking the batch protocol (see batch_server).
+
+    Falls back to run_test_case when the solution does not answer the handshake.
+    Times are measured around each request; max_rss_kb is the peak of the
+    process so far (it is shared by the cases the process has solved).
+    """
+    server = batch_server.get_server([solution_file], mem_mb=mem_limit_mb)
+    if server is None:
+        return run_test_case(
+            case_str, input_file, output_file, solution_file, case_scorer, fail_score,
+            tle_limit_ms, tle_margin_ratio, time_measure=time_measure, mem_limit_mb=mem_limit_mb,
+        )
+
+    timeout_limit_ms = tle_limit_ms * (1.0 + tle_margin_ratio)
+    timeout_sec = timeout_limit_ms / 1000.0
+    if time_measure == "cpu":
+        timeout_sec *= CPU_MODE_WALL_FACTOR
+    with open(input_file, "rb") as f:
+        input_data = f.read()
+    # TLE / RE の場合、プロセスは止められ次のケースで起動し直される
+    res = server.solve(input_data, timeout_sec)
+    with open(output_file, "wb") as f:
+        f.write(res["output"])
+    run = {
+        "status": res["status"],
+        "signal": None,
+        "elapsed_ms": res["elapsed_ms"],
+        "cpu_ms": res["cpu_ms"],
+        "max_rss_kb": res["max_rss_kb"],
+    }
+    result = _case_result(case_str, run, fail_score, timeout_limit_ms, time_measure)
+    if result["exit_status"] != "OK":
+        return result
+
+    score = case_scorer.score(input_file, output_file)
+    result["score"] = fail_score if score is None else score
+    return result
+
+
+# tester が起動するコマンドをこのラッパーで包み、ソリューション側だけの wall / CPU 時間をファイルへ書き出す
+# （ラッパー自体の起動時間は計測区間に入らない）
+# argv[1]: ソリューション, argv[2]: 出力先ファイル（tester が fd を閉じても届くようパスで渡す）
+INTERACTIVE_WRAPPER = """
+import os, sys, time
+start = time.perf_counter()
+pid = os.posix_spawn(sys.argv[1], [sys.argv[1]], os.environ)
+_, status, ru = os.wait4(pid, 0)
+elapsed_ms = (time.perf_counter() - start) * 1000.0
+with open(sys.argv[2], "w") as f:
+    f.write(f"{elapsed_ms} {(ru.ru_utime + ru.ru_stime) * 1000.0}\\n")
+code = os.waitstatus_to_exitcode(status)
+sys.exit(code if code >= 0 else 128 - code)
+"""
+
+
+def _read_solution_times(path):
+    """(elapsed_ms, cpu_ms) of the solution written by INTERACTIVE_WRAPPER, or None."""
+    with open(path, "r") as f:
+        fields = f.read().split()
+    if len(fields) != 2:
+        return None
+    return float(fields[0]), float(fields[1])
+
+
+def run_interactive_case(
+    case_str,
+    input_file,
+    output_file,
+    solution_file,
+    tester_file,
+    score_prefix,
+    fail_score,
+    tle_limit_ms,
+    tle_margin_ratio,
+    time_measure="wall",
+    mem_limit_mb=0,
+):
+    """Run `tester solution < input > output` and read the score from tester's stderr.
+
+    The tester drives the solution over its own pipes. stderr (tester and solution
+    debug output) is drained line by line while the case runs, so neither side can
+    block on a full pipe and only the score line is kept in memory.
+    """
+    timeout_limit_ms = tle_limit_ms * (1.0 + tle_margin_ratio)
+    timeout_sec = timeout_limit_ms / 1000.0
+    if time_measure == "cpu":
+        timeout_sec *= CPU_MODE_WALL_FACTOR
+
+    times_fd, times_file = tempfile.mkstemp(prefix="ahc-times-")
+    os.close(times_fd)
+    cmd = [tester_file, sys.executable, "-c", INTERACTIVE_WRAPPER, solution_file, times_file]
+    score_line = None
+
+    def _on_stderr(line):
+        nonlocal score_line
+        if score_line is None and line.strip().startswith(score_prefix):
+            score_line = line
+
+    # tester とソリューションは同じプロセスグループで起動され、タイムアウト時はまとめて止まる
+    # CPU / メモリの上限は tester 経由でソリューションにも継承される
     try:
         with open(input_file, "r") as fin, open(output_file, "w") as fout:
-            subprocess.run(
-                cmd_cpp,
+            run = process_util.run_limited(
+                cmd,
                 stdin=fin,
                 stdout=fout,
-                stderr=subprocess.DEVNULL,
-                text=True,
-                check=False,
-                timeout=timeout_sec,
+                wall_sec=timeout_sec,
+                cpu_sec=timeout_limit_ms / 1000.0,
+                mem_mb=mem_limit_mb,
+                on_stderr=_on_stderr,
             )
-    except subprocess.TimeoutExpired:
-        elapsed_time_ms = (time.perf_counter() - start_time) * 1000.0
-        return {
-            "case": case_str,
-            "score": fail_score,
-            "elapsed_time": elapsed_time_ms,
-            "tle": True,
-        }
-
-    elapsed_time_ms = (time.perf_counter() - start_time) * 1000.0
-
-    if elapsed_time_ms > timeout_limit_ms:
-        return {
-            "case": case_str,
-            "score": fail_score,
-            "elapsed_time": elapsed_time_ms,
-            "tle": True,
-        }
-
-    res = subprocess.run(
-        [vis_file, input_file, output_file],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-        text=True,
-        check=False,
+        solution_times = _read_solution_times(times_file)
+    finally:
+        os.remove(times_file)
+    # wall / CPU 時間ともソリューション側だけの値で判定する
+    # 取れない場合（強制終了など）は tester を含む時間で代用し、ピークメモリは tester とソリューションの大きい方
+    if solution_times is not None:
+        run["elapsed_ms"], run["cpu_ms"] = solution_times
+
+    result = _case_result(case_str, run, fail_score, timeout_limit_ms, time_measure)
+    if result["exit_status"] != "OK":
+        return result
+
+    score = scorer.parse_score(score_line or "", score_prefix)
+    result["score"] = fail_score if score is None else score
+    return result
+
+
+def run_cases(cases, case_func, jobs=1, pin=False, events=None):
+    """Run (case_str, input_file, output_file) tuples and yield results as each one finishes.
+
+    Each result gets "worker": the slot (0..jobs-1) that ran it. events: optional
+    telemetry.EventLog that receives a case_started event per case.
+    """
+    if jobs <= 1:
+        for case in cases:
+            if events is not None:
+                events.emit("case_started", case=case[0], worker=0)
+            result = case_func(*case)
+            result["worker"] = 0
+            yield result
+        return
+
+    # 投入は空いたスロットの数だけにして、投入時刻 = 開始時刻・スロット番号 = ワーカー ID として扱えるようにする
+    pool = parallel_util.create_pool(jobs, pin=pin)
+    pending = iter(cases)
+    running = {}
+    free_slots = list(range(jobs - 1, -1, -1))
+    try:
+        while True:
+            while free_slots:
+                case = next(pending, None)
+                if case is None:
+                    break
+                slot = free_slots.pop()
+                if events is not None:
+                    events.emit("case_started", case=case[0], worker=slot)
+                running[pool.submit(case_func, *case)] = slot
+            if not running:
+                break
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                slot = running.pop(future)
+                free_slots.append(slot)
+                result = future.result()
+                result["worker"] = slot
+                yield result
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def collect_cases(config, seeds, output_dir):
+    """(case_str, input_file, output_file) for each seed whose input exists."""
+    input_dir = os.path.join(config_util.work_dir(), config["paths"]["testcase_input_dir"])
+    cases = []
+    for i in seeds:
+        case_str = f"{i:04d}"
+        input_file = os.path.join(input_dir, case_str + ".txt")
+        output_file = os.path.join(output_dir, case_str + ".txt")
+        if not os.path.exists(input_file):
+            print(f"Error: {input_file} was not found.")
+            continue
+        cases.append((case_str, input_file, output_file))
+    return cases
+
+
+def read_seeds_file(path: str) -> list:
+    """Seeds listed one per line (blank lines and lines starting with # are ignored), e.g. by seed_select.py."""
+    seeds = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                seeds.append(int(line))
+    return seeds
+
+
+def make_case_func(config, solution_file, batch=False):
+    """run_test_case (or run_interactive_case) bound to the settings in config.toml (picklable for the worker pool).
+
+    batch=True uses run_batch_case for non-interactive problems. Outputs are scored
+    by the scorer of [scorer] in config.toml (see scorer.load_scorer).
+    """
+    work_dir = config_util.work_dir()
+    if config["problem"]["interactive"]:
+        return functools.partial(
+            run_interactive_case,
+            solution_file=solution_file,
+            tester_file=os.path.join(work_dir, config["files"]["tester_file"]),
+            score_prefix=config["problem"]["score_prefix"],
+            fail_score=failure_score(config["problem"]["objective"]),
+            tle_limit_ms=config["problem"]["time_limit_ms"] * TLE_FACTOR,
+            tle_margin_ratio=TLE_MARGIN_RATIO,
+            time_measure=config_util.get_option(config, "runner", "time_measure", "wall"),
+            mem_limit_mb=config_util.get_option(config, "runner", "memory_limit_mb", 0),
+        )
+    return functools.partial(
+        run_batch_case if batch else run_test_case,
+        solution_file=solution_file,
+        case_scorer=scorer.load_scorer(config),
+        fail_score=failure_score(config["problem"]["objective"]),
+        tle_limit_ms=config["problem"]["time_limit_ms"] * TLE_FACTOR,
+        tle_margin_ratio=TLE_MARGIN_RATIO,
+        time_measure=config_util.get_option(config, "runner", "time_measure", "wall"),
+        mem_limit_mb=config_util.get_option(config, "runner", "memory_limit_mb", 0),
     )
 
-    score = fail_score
-    for line in res.stdout.splitlines():
-        line = line.strip()
-        if line.startswith(score_prefix):
-            try:
-                score = int(line.split("=")[-1].strip())
-            except Exception:
-                score = fail_score
-            break
 
-    return {
-        "case": case_str,
-        "score": score,
-        "elapsed_time": elapsed_time_ms,
-        "tle": False,
-    }
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run pretests and report scores.")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=parallel_util.default_jobs(),
+        help="Number of parallel workers (default: physical cores - 1).",
+    )
+    parser.add_argument(
+        "--pin",
+        action="store_true",
+        help="Pin each worker to its own CPU.",
+    )
+    parser.add_argument(
+        "--no-history",
+        action="store_true",
+        help="Do not save this run to the history database.",
+    )
+    parser.add_argument(
+        "--label",
+        default=None,
+        help="Label stored with this run in the history database.",
+    )
+    parser.add_argument(
+        "--relative",
+        action="store_true",
+        help="Report relative scores against the per-seed best known scores.",
+    )
+    parser.add_argument(
+        "--seeds-file",
+        default=None,
+        help="Run only the seeds listed in this file (e.g. written by seed_select.py) instead of the first pretest_count.",
+    )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Keep one solution process per worker and send the cases over the batch protocol (AHC_BATCH).",
+    )
+    parser.add_argument(
+        "--events",
+        default=None,
+        help="Append JSON-lines telemetry events (case started / finished) to this file.",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="Show a live progress line (cases/s, ETA, running mean) instead of one line per case.",
+    )
+    return parser.parse_args()
 
 
 def main():
+    args = parse_args()
+
     # コンパイル
     config = config_util.load_config()
     build.compile_program(config)
 
     work_dir = config_util.work_dir()
-    input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
     output_dir = os.path.join(work_dir, config["paths"]["testcase_output_dir"])
     solution_file = os.path.join(work_dir, config["files"]["sol_file"])
-    vis_file = os.path.join(work_dir, config["files"]["vis_file"])
-    score_prefix = config["problem"]["score_prefix"]
     objective = config["problem"]["objective"]
     fail_score = failure_score(objective)
     tle_limit_ms = config["problem"]["time_limit_ms"] * TLE_FACTOR
-    # 非インタラクティブ前提の簡易テスト（interactive は参照のみ）
-    is_interactive = config["problem"]["interactive"]
-
+    # TLE 判定に使う時間: "wall"（経過時間）または "cpu"（user+sys）
+    time_measure = config_util.get_option(config, "runner", "time_measure", "wall")
+    time_key = "cpu_time" if time_measure == "cpu" else "elapsed_time"
     os.makedirs(output_dir, exist_ok=True)
-    
+
     # テストケースの実行結果
-    testcase_count = config["problem"]["pretest_count"]
+    # --seeds-file があればそのシードだけ（代表シードでの高速評価）、なければ先頭 pretest_count 個
+    if args.seeds_file:
+        seeds = read_seeds_file(os.path.join(work_dir, args.seeds_file))
+    else:
+        seeds = range(config["problem"]["pretest_count"])
+    testcase_count = len(seeds)
     wrong_answer_count = 0
     results = []
+    all_results = []
 
-    # シンプルな逐次実行に限定
-    for i in range(testcase_count):
-        case_str = f"{i:04d}"
-        input_file = os.path.join(input_dir, case_str + ".txt")
-        output_file = os.path.join(output_dir, case_str + ".txt")
-        if not os.path.exists(input_file):
-            print(f"Error: {input_file} was not found.")
-            continue
-        result = run_test_case(
-            case_str,
-            input_file,
-            output_file,
-            solution_file,
-            vis_file,
-            score_prefix,
-            fail_score,
-            tle_limit_ms,
-            TLE_MARGIN_RATIO,
-        )
-        score = result['score']
-        if result['tle']:
-            wrong_answer_count += 1
-            print(
-                f"Error: {result['case']} exceeded TL ({result['elapsed_time']:.2f} ms > {(tle_limit_ms * (1.0 + TLE_MARGIN_RATIO)):.2f} ms)."
-            )
-            continue
-        if score == fail_score:
-            wrong_answer_count += 1
-            print(f"Error: {result['case']} failed to get score.")
-            continue
-        results.append(result)
-        print(f"seed:{result['case']}  score:{result['score']:,d}  ({result['elapsed_time']:.2f} ms)")
+    cases = collect_cases(config, seeds, output_dir)
+    case_func = make_case_func(config, solution_file, batch=args.batch)
+
+    # テレメトリ: --events でイベントを JSON Lines に追記、--progress で進捗を 1 行表示
+    view = telemetry.ProgressView(len(cases)) if args.progress else None
+    events = telemetry.create(args.events, view)
+    if events is not None:
+        events.emit("run_started", total=len(cases), jobs=args.jobs)
+
+    # jobs > 1 ならワーカープールで並列実行し、終わったケースから順に表示する
+    try:
+        for result in run_cases(cases, case_func, jobs=args.jobs, pin=args.pin, events=events):
+            score = result['score']
+            all_results.append(result)
+            if result['tle']:
+                result['status'] = "TLE"
+                wrong_answer_count += 1
+                print(
+                    f"Error: {result['case']} exceeded TL ({result[time_key]:.2f} ms > {(tle_limit_ms * (1.0 + TLE_MARGIN_RATIO)):.2f} ms)."
+                )
+            elif result['exit_status'] != "OK":
+                # MLE / RE（シグナルで落ちた場合はシグナル名も表示）
+                result['status'] = result['exit_status']
+                wrong_answer_count += 1
+                detail = f" ({result['signal']})" if result['signal'] else ""
+                print(f"Error: {result['case']} {result['exit_status']}{detail}.")
+            elif score == fail_score:
+                result['status'] = "WA"
+                wrong_answer_count += 1
+                print(f"Error: {result['case']} failed to get score.")
+            else:
+                result['status'] = "OK"
+                results.append(result)
+                if view is None:
+                    print(f"seed:{result['case']}  score:{result['score']:,d}  ({result['elapsed_time']:.2f} ms)")
+            if events is not None:
+                events.emit(
+                    "case_finished",
+                    case=result['case'],
+                    worker=result['worker'],
+                    status=result['status'],
+                    score=result['score'],
+                    elapsed_ms=round(result['elapsed_time'], 3),
+                    cpu_ms=round(result['cpu_time'], 3),
+                )
+    finally:
+        if events is not None:
+            events.emit("run_finished", finished=len(all_results), wrong_answers=wrong_answer_count)
+            events.close()
+
+    # 実行結果を履歴 DB に保存（ソリューションバイナリのハッシュ + 時刻で識別）
+    # 保存時にシードごとのベストスコア表も更新する
+    best_scores = None
+    if (args.relative or not args.no_history) and all_results:
+        all_results.sort(key=lambda r: r['case'])
+        conn = history.connect(config)
+        if args.relative:
+            best_scores = history.load_best_scores(conn)
+        if not args.no_history:
+            run_id = history.record_run(conn, history.file_hash(solution_file), all_results, label=args.label)
+            history.update_best_scores(conn, run_id, all_results, objective)
+            print(f"Saved run #{run_id} to {history.db_path(config)}")
+        conn.close()
 
     if len(results) == 0:
         print("No results to display.")
         exit(0)
-    
+
+    # 完了順に依存しないようシード順に並べ直してから集計する
+    results.sort(key=lambda r: r['case'])
+
+    arrays = analytics.result_arrays(results, time_key=time_key)
+    scores, times, mem = arrays["scores"], arrays["times"], arrays["max_rss_kb"]
+
     # スコアの合計と平均を計算
-    total_score = sum(result['score'] for result in results)
+    total_score = int(scores.sum())
     avg_score = total_score / len(results)
+    ci_low, ci_high = analytics.bootstrap_ci(scores)
 
-    # 最大実行時間を取得
-    max_time_result = max(results, key=lambda r: r['elapsed_time'])
-    max_time = max_time_result['elapsed_time']
-    max_time_case = max_time_result['case']
+    # 最大実行時間・メモリと p95 を取得
+    max_time_idx = int(times.argmax())
+    max_time = float(times[max_time_idx])
+    max_time_case = results[max_time_idx]['case']
+    p95_time = analytics.quantile(times, 95)
+    max_mem_idx = int(mem.argmax())
+    max_mem_mb = float(mem[max_mem_idx]) / 1024.0
+    p95_mem_mb = analytics.quantile(mem, 95) / 1024.0
 
     print(f"----- All test cases finished (total {testcase_count}) -----")
     print(f"Wrong Answers: {wrong_answer_count} / {testcase_count}")
-    print(f"Maximum Execution Time: {max_time:.2f} ms (case: {max_time_case})")
+    print(f"Maximum Execution Time: {max_time:.2f} ms (case: {max_time_case}, {time_measure})")
+    print(f"95th Percentile Execution Time: {p95_time:.2f} ms")
+    print(f"Maximum Memory: {max_mem_mb:.2f} MB (case: {results[max_mem_idx]['case']})")
+    print(f"95th Percentile Memory: {p95_mem_mb:.2f} MB")
     print(f"Total Score: {total_score:,d}")
     print(f"Average Score: {avg_score:.2f}")
+    print(f"Average Score 95% CI: [{ci_low:.2f}, {ci_high:.2f}]")
+    print(f"Geometric Mean Score: {analytics.geometric_mean(scores):.2f}")
+
+    if best_scores is not None:
+        history.relative_report(best_scores, all_results, objective)
 
     return {
         "wrong_answers": wrong_answer_count,
@@ -0,0 +1,193 @@
+import argparse
+import build
+import config_util as config_util
+import numpy as np
+import os
+import run_test
+import sys
+import tempfile
+
+MIN_TIME_MS = 0.01  # log を取るための下限
+TL_WARN_RATIO = 0.9  # 予測時間が TL のこの割合を超えたら警告
+
+
+def read_header_features(input_file: str) -> list:
+    """Numbers on the first line of an input file (N, M, ... in most AHC problems)."""
+    with open(input_file, "r") as f:
+        line = f.readline()
+    features = []
+    for token in line.split():
+        try:
+            features.append(float(token))
+        except ValueError:
+            break
+    return features
+
+
+def feature_matrix(input_files) -> np.ndarray:
+    """(cases x features) array of the header numbers, padded with NaN when lines differ in length."""
+    rows = [read_header_features(path) for path in input_files]
+    width = max((len(r) for r in rows), default=0)
+    matrix = np.full((len(rows), width), np.nan)
+    for i, r in enumerate(rows):
+        matrix[i, :len(r)] = r
+    return matrix
+
+
+def fit_scaling(features: np.ndarray, times_ms: np.ndarray) -> dict:
+    """Fit log(time) = c + sum_i b_i * log(x_i) by least squares.
+
+    Only header columns that are positive on every case and take more than one
+    value are used. Returns cols, exponents, intercept, r2 and the residual std
+    (in log space).
+    """
+    cols = [
+        j for j in range(features.shape[1])
+        if np.all(features[:, j] > 0) and np.unique(features[:, j]).size > 1
+    ]
+    y = np.log(np.maximum(times_ms, MIN_TIME_MS))
+    design = np.column_stack([np.ones(len(y))] + [np.log(features[:, j]) for j in cols])
+    coef, *_ = np.linalg.lstsq(design, y, rcond=None)
+    resid = y - design @ coef
+    ss_tot = float(((y - y.mean()) ** 2).sum())
+    r2 = 1.0 - float((resid ** 2).sum()) / ss_tot if ss_tot > 0 else 1.0
+    return {
+        "cols": cols,
+        "exponents": coef[1:],
+        "intercept": float(coef[0]),
+        "r2": r2,
+        "resid_std": float(resid.std()),
+    }
+
+
+def predict(fit: dict, features: np.ndarray) -> np.ndarray:
+    """Fitted time (ms) for each row of features."""
+    features = np.atleast_2d(features)
+    log_t = np.full(features.shape[0], fit["intercept"])
+    for b, j in zip(fit["exponents"], fit["cols"]):
+        log_t += b * np.log(features[:, j])
+    return np.exp(log_t)
+
+
+def measure(config, solution_file, cases, jobs, repeat):
+    """Median time (ms, config's time_measure) per case over `repeat` runs."""
+    time_key = "cpu_time" if config_util.get_option(config, "runner", "time_measure", "wall") == "cpu" else "elapsed_time"
+    case_func = run_test.make_case_func(config, solution_file)
+    index = {case[0]: i for i, case in enumerate(cases)}
+    times = np.empty((repeat, len(cases)))
+    for r in range(repeat):
+        for result in run_test.run_cases(cases, case_func, jobs=jobs):
+            times[r, index[result["case"]]] = result[time_key]
+    return np.median(times, axis=0)
+
+
+def format_fit(fit: dict, names) -> str:
+    if not fit["cols"]:
+        return f"constant ({np.exp(fit['intercept']):.2f} ms)"
+    terms = " * ".join(f"{names[j]}^{b:.2f}" for b, j in zip(fit["exponents"], fit["cols"]))
+    return f"{np.exp(fit['intercept']):.3g} * {terms}  (R^2 = {fit['r2']:.3f})"
+
+
+def report(label, fit, features, times, case_names, tl_ms, judge_factor, top):
+    """Print the fit and the seeds whose measured or fitted time on the judge is close to the TL."""
+    names = [f"x{j}" for j in range(features.shape[1])]
+    print(f"[{label}] time ≈ {format_fit(fit, names)}")
+    fitted = predict(fit, features)
+    # ジャッジ上の予測時間: 実測とフィットの大きい方 × ジャッジとの速度比
+    projected = np.maximum(times, fitted) * judge_factor
+    order = np.argsort(-projected)
+    flagged = [i for i in order if projected[i] > tl_ms * TL_WARN_RATIO]
+    for i in order[:top]:
+        mark = "  <-- over TL" if projected[i] > tl_ms else ("  <-- near TL" if i in flagged else "")
+        header = " ".join(f"{v:g}" for v in features[i] if not np.isnan(v))
+        print(f"  seed:{case_names[i]}  [{header}]  measured {times[i]:.1f} ms  fitted {fitted[i]:.1f} ms  judge {projected[i]:.1f} ms{mark}")
+    print(f"  {len(flagged)} seed(s) projected above {TL_WARN_RATIO:.0%} of TL ({tl_ms} ms) on the judge.")
+    return fitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit runtime against input size and flag seeds at risk of TLE.")
+    parser.add_argument("--solution", default=None, help="Solution binary (default: build the current cpp_file).")
+    parser.add_argument("--baseline", default=None, help="Also measure this binary and compare the fitted curves.")
+    parser.add_argument("--seeds", type=int, default=None, help="Number of seeds (default: pretest_count).")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=1,
+        help="Parallel workers (default: 1, parallel runs disturb timing).",
+    )
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per seed; the median time is used.")
+    parser.add_argument(
+        "--judge-factor",
+        type=float,
+        default=1.0,
+        help="Judge time / local time ratio used for the projection.",
+    )
+    parser.add_argument(
+        "--max-features",
+        default=None,
+        help="Comma separated upper bounds of the header values (e.g. the constraints) to project the worst case.",
+    )
+    parser.add_argument("--top", type=int, default=10, help="Slowest seeds to list.")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    tl_ms = config["problem"]["time_limit_ms"]
+    if args.solution is None:
+        solution = build.compile_program(config)
+    else:
+        solution = os.path.join(work_dir, args.solution)
+    binaries = [("solution", solution)]
+    if args.baseline:
+        binaries.insert(0, ("baseline", os.path.join(work_dir, args.baseline)))
+    for _, path in binaries:
+        if not os.path.isfile(path):
+            print(f"Error: {path} was not found.", file=sys.stderr)
+            sys.exit(1)
+
+    seeds = range(args.seeds or config["problem"]["pretest_count"])
+    with tempfile.TemporaryDirectory() as out_dir:
+        cases = run_test.collect_cases(config, seeds, out_dir)
+        if len(cases) < 2:
+            print("Error: at least 2 input files are needed.", file=sys.stderr)
+            sys.exit(1)
+        features = feature_matrix([case[1] for case in cases])
+        case_names = [case[0] for case in cases]
+        measured = {}
+        for label, path in binaries:
+            print(f"Measuring {label} ({os.path.basename(path)}) on {len(cases)} seeds ...")
+            measured[label] = measure(config, path, cases, max(1, args.jobs), max(1, args.repeat))
+
+    max_row = None
+    if args.max_features:
+        max_row = np.array([[float(v) for v in args.max_features.split(",")]])
+        if max_row.shape[1] < features.shape[1]:
+            max_row = np.pad(max_row, ((0, 0), (0, features.shape[1] - max_row.shape[1])), constant_values=np.nan)
+
+    fits = {}
+    fitted = {}
+    for label, _ in binaries:
+        fits[label] = fit_scaling(features, measured[label])
+        fitted[label] = report(label, fits[label], features, measured[label], case_names, tl_ms, args.judge_factor, args.top)
+        if max_row is not None:
+            worst = float(predict(fits[label], max_row)[0]) * args.judge_factor
+            mark = "  <-- over TL" if worst > tl_ms else ""
+            print(f"  worst case at [{args.max_features}]: {worst:.1f} ms on the judge{mark}")
+
+    if args.baseline:
+        # 同じ入力上でのフィット同士の比。入力サイズの大きい側で比が大きいならホットパスが遅くなっている
+        ratio = fitted["solution"] / fitted["baseline"]
+        size = np.exp(np.log(np.where(features > 0, features, 1.0)).sum(axis=1))
+        order = np.argsort(size)
+        half = len(order) // 2
+        print("----- solution vs baseline -----")
+        print(f"Measured time ratio (median): {np.median(measured['solution'] / np.maximum(measured['baseline'], MIN_TIME_MS)):.3f}")
+        print(f"Fitted time ratio: small inputs {ratio[order[:half]].mean():.3f}, large inputs {ratio[order[half:]].mean():.3f}")
+        if max_row is not None:
+            worst_ratio = float(predict(fits["solution"], max_row)[0] / predict(fits["baseline"], max_row)[0])
+            print(f"Fitted time ratio at [{args.max_features}]: {worst_ratio:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import batch_server
+import config_util as config_util
+import ctypes
+import importlib.util
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+
+KINDS = ("vis", "vis_batch", "python", "ctypes")
+SCORE_TIMEOUT_SEC = 60.0  # vis_batch で 1 組の採点を待つ最大時間（秒）
+VIS_HANDSHAKE_TIMEOUT = 1.0  # vis_batch で vis の起動（ハンドシェイク）を待つ最大時間（秒）
+CTYPES_FUNC = "ahc_score"
+
+
+def parse_score(text: str, score_prefix: str):
+    """Score from the first line starting with score_prefix (None if missing or not an integer)."""
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith(score_prefix):
+            try:
+                return int(line.split("=")[-1].strip())
+            except ValueError:
+                return None
+    return None
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class VisScorer:
+    """Runs `vis input output` once per case and reads the score line (the default)."""
+
+    def __init__(self, vis_file: str, score_prefix: str):
+        self.vis_file = vis_file
+        self.score_prefix = score_prefix
+
+    def score(self, input_file: str, output_file: str, pass_fds=()):
+        """Score of output_file for input_file, or None. pass_fds: fds the output path refers to (/dev/fd/N)."""
+        res = subprocess.run(
+            [self.vis_file, input_file, output_file],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=False,
+            pass_fds=pass_fds,
+        )
+        return parse_score(res.stdout, self.score_prefix)
+
+
+class BatchVisScorer:
+    """A long-lived `vis` that scores many (input, output) pairs over the batch protocol.
+
+    The official vis does not implement this protocol: it needs a vis modified to
+    be started with AHC_BATCH=1 and answer "AHC_BATCH 1" like a batch solution
+    (see batch_server). Per pair it receives "<bytes>\\n" + the input path, a newline
+    and the output, and answers "<bytes>\\n" + text containing the score line.
+    load_scorer checks the handshake once and stops if vis does not answer.
+    One process is kept per thread.
+    """
+
+    def __init__(self, vis_file: str, score_prefix: str):
+        self.vis_file = vis_file
+        self.score_prefix = score_prefix
+
+    def score(self, input_file: str, output_file: str, pass_fds=()):
+        server = batch_server.get_server([self.vis_file], handshake_timeout=VIS_HANDSHAKE_TIMEOUT)
+        if server is None:
+            return VisScorer(self.vis_file, self.score_prefix).score(input_file, output_file, pass_fds=pass_fds)
+        request = os.path.abspath(input_file).encode() + b"\n" + _read_bytes(output_file)
+        res = server.solve(request, SCORE_TIMEOUT_SEC)
+        if res["status"] != "OK":
+            return None
+        return parse_score(res["output"].decode(errors="replace"), self.score_prefix)
+
+
+# モジュール・共有ライブラリはプロセスごとに 1 回だけ読み込む
+_loaded = {}
+_loaded_lock = threading.Lock()
+# score() の例外は種類ごとにプロセスで 1 回だけトレースバックを表示する
+_reported = set()
+
+
+def _load_once(path: str, loader):
+    with _loaded_lock:
+        if path not in _loaded:
+            _loaded[path] = loader(path)
+        return _loaded[path]
+
+
+def _load_module(path: str):
+    spec = importlib.util.spec_from_file_location(f"ahc_scorer_{abs(hash(path))}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if not callable(getattr(module, "score", None)):
+        raise AttributeError(f"{path} does not define score(input_text, output_text).")
+    return module
+
+
+def _load_library(path: str):
+    lib = ctypes.CDLL(path)
+    func = getattr(lib, CTYPES_FUNC)
+    func.argtypes = [ctypes.c_char_p, ctypes.c_size_t, ctypes.c_char_p, ctypes.c_size_t]
+    func.restype = ctypes.c_longlong
+    return func
+
+
+class PythonScorer:
+    """Calls score(input_text, output_text) of a Python file in this process.
+
+    The function returns the score, or None for an invalid output. The file is
+    imported once per worker process. If it raises, the case fails and the
+    traceback is printed (once per exception type and process).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def score(self, input_file: str, output_file: str, pass_fds=()):
+        module = _load_once(self.path, _load_module)
+        with open(input_file, "r") as f:
+            input_text = f.read()
+        with open(output_file, "r") as f:
+            output_text = f.read()
+        try:
+            value = module.score(input_text, output_text)
+        except Exception as e:
+            # 採点関数のバグが解の失敗（スコアなし）に見えないよう、トレースバックを出す
+            with _loaded_lock:
+                first = type(e) not in _reported
+                _reported.add(type(e))
+            if first:
+                print(
+                    f"Error: score() of {self.path} raised {type(e).__name__} on {os.path.basename(input_file)} "
+                    f"(the case counts as failed; later {type(e).__name__}s are not shown):\n{traceback.format_exc()}",
+                    file=sys.stderr,
+                )
+            return None
+        return None if value is None else int(value)
+
+
+class CtypesScorer:
+    """Calls `long long ahc_score(const char* in, size_t in_len, const char* out, size_t out_len)`
+    of a shared library in this process. A negative return value means an invalid output.
+
+    The function may be called from several threads at once, so it must not keep global state.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def score(self, input_file: str, output_file: str, pass_fds=()):
+        func = _load_once(self.path, _load_library)
+        input_data = _read_bytes(input_file)
+        output_data = _read_bytes(output_file)
+        value = func(input_data, len(input_data), output_data, len(output_data))
+        return None if value < 0 else int(value)
+
+
+def load_scorer(config):
+    """Scorer selected by [scorer] kind in config.toml (vis / vis_batch / python / ctypes).
+
+    python / ctypes load [scorer] path (relative to the work directory). Scorers are
+    picklable and load their module, library or process lazily in each worker.
+    """
+    work_dir = config_util.work_dir()
+    vis_file = os.path.join(work_dir, config["files"]["vis_file"])
+    score_prefix = config["problem"]["score_prefix"]
+    kind = config_util.get_option(config, "scorer", "kind", "vis")
+    if kind == "vis":
+        return VisScorer(vis_file, score_prefix)
+    if kind == "vis_batch":
+        # 公式の vis はバッチプロトコルに対応していないため、ケースを流す前に 1 度だけ確かめる
+        probe = batch_server.BatchSolution([vis_file], handshake_timeout=VIS_HANDSHAKE_TIMEOUT)
+        if not probe.start():
+            print(
+                f"Error: {vis_file} does not speak the batch protocol required by [scorer] kind = \"vis_batch\" "
+                "(it needs a modified vis; use kind = \"vis\" for the official one).",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        probe.close()
+        return BatchVisScorer(vis_file, score_prefix)
+    if kind in ("python", "ctypes"):
+        path = config_util.get_option(config, "scorer", "path", "")
+        if not path:
+            print(f"Error: [scorer] path is required for kind = \"{kind}\".", file=sys.stderr)
+            sys.exit(1)
+        path = os.path.join(work_dir, path)
+        if not os.path.isfile(path):
+            print(f"Error: scorer {path} was not found.", file=sys.stderr)
+            sys.exit(1)
+        return PythonScorer(path) if kind == "python" else CtypesScorer(path)
+    print(f"Error: unknown [scorer] kind \"{kind}\" (expected one of {', '.join(KINDS)}).", file=sys.stderr)
+    sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the configured scorer against vis and compare the per-case latency.")
+    parser.add_argument("--cases", type=int, default=50, help="Number of (input, output) pairs to score.")
+    parser.add_argument("--repeat", type=int, default=3, help="Rounds over the pairs; the median time is used.")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
+    output_dir = os.path.join(work_dir, config["paths"]["testcase_output_dir"])
+    names = sorted(os.listdir(output_dir)) if os.path.isdir(output_dir) else []
+    pairs = [
+        (os.path.join(input_dir, name), os.path.join(output_dir, name))
+        for name in names
+        if os.path.isfile(os.path.join(input_dir, name))
+    ][:max(1, args.cases)]
+    if not pairs:
+        print(f"Error: no outputs in {output_dir} (run run_test.py first).", file=sys.stderr)
+        sys.exit(1)
+
+    scorer = load_scorer(config)
+    reference = VisScorer(os.path.join(work_dir, config["files"]["vis_file"]), config["problem"]["score_prefix"])
+    # 採点結果が vis と一致するかを確認する
+    mismatches = 0
+    for input_file, output_file in pairs:
+        expected = reference.score(input_file, output_file)
+        actual = scorer.score(input_file, output_file)
+        if expected != actual:
+            mismatches += 1
+            print(f"Mismatch: {os.path.basename(input_file)}  vis={expected}  {type(scorer).__name__}={actual}")
+
+    def _per_case_ms(s):
+        rounds = []
+        for _ in range(max(1, args.repeat)):
+            start_time = time.perf_counter()
+            for input_file, output_file in pairs:
+                s.score(input_file, output_file)
+            rounds.append((time.perf_counter() - start_time) * 1000.0 / len(pairs))
+        rounds.sort()
+        return rounds[len(rounds) // 2]
+
+    vis_ms = _per_case_ms(reference)
+    scorer_ms = _per_case_ms(scorer)
+    print(f"Pairs: {len(pairs)}  mismatches: {mismatches}")
+    print(f"vis (one process per case): {vis_ms:.3f} ms / case")
+    print(f"{type(scorer).__name__}: {scorer_ms:.3f} ms / case")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import analytics
+import argparse
+import config_util as config_util
+import history
+import numpy as np
+import os
+import scaling_bench
+import sys
+from scipy import stats
+
+RUN_COVERAGE = 0.9  # シード数がこの割合に満たない run（部分実行など）は使わない
+VARIANCE_SPLIT_MIN = 4  # この数以上のシードがあるサイズ帯は、スコアの分散の大小でさらに 2 つに分ける
+
+
+def pick_runs(conn, limit: int) -> list:
+    """run_ids of the latest run of each of the `limit` most recent solutions that cover most seeds."""
+    rows = conn.execute(
+        "SELECT r.run_id, r.sol_hash, COUNT(x.seed) FROM runs r JOIN results x ON x.run_id = r.run_id "
+        "GROUP BY r.run_id ORDER BY r.run_id DESC"
+    ).fetchall()
+    seen = set()
+    runs = []
+    for run_id, sol_hash, count in rows:
+        if sol_hash in seen:
+            continue
+        seen.add(sol_hash)
+        runs.append((run_id, count))
+    if not runs:
+        return []
+    max_count = max(count for _, count in runs)
+    runs = [run_id for run_id, count in runs if count >= max_count * RUN_COVERAGE]
+    return runs[:limit]
+
+
+def relative_matrix(conn, run_ids, objective: str):
+    """(seeds, matrix) of relative scores (runs x seeds) against the best of these runs.
+
+    Failed cases count as 0. Seeds missing from any of the runs are dropped.
+    """
+    placeholders = ",".join("?" * len(run_ids))
+    rows = conn.execute(
+        f"SELECT run_id, seed, score, status FROM results WHERE run_id IN ({placeholders})",
+        list(run_ids),
+    ).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((len(run_ids), 0))
+    seeds, seed_idx = np.unique(np.array([r[1] for r in rows], dtype=np.int64), return_inverse=True)
+    run_pos = {run_id: i for i, run_id in enumerate(run_ids)}
+    scores = np.full((len(run_ids), len(seeds)), np.nan)
+    ok = np.zeros(scores.shape, dtype=bool)
+    for (run_id, _, score, status), j in zip(rows, seed_idx):
+        scores[run_pos[run_id], j] = score
+        ok[run_pos[run_id], j] = status == "OK"
+    complete = ~np.isnan(scores).any(axis=0)
+    seeds, scores, ok = seeds[complete], scores[:, complete], ok[:, complete]
+
+    masked = np.where(ok, scores, np.nan)
+    with np.errstate(all="ignore"):
+        best = np.nanmax(masked, axis=0) if objective == "maximize" else np.nanmin(masked, axis=0)
+    rel = analytics.relative(np.nan_to_num(scores), np.nan_to_num(best), objective)
+    return seeds, np.where(ok, rel, 0.0)
+
+
+def log_sizes(input_dir: str, seeds) -> np.ndarray:
+    """log of the product of the positive header numbers of each input (NaN if it is missing)."""
+    sizes = np.full(len(seeds), np.nan)
+    for k, seed in enumerate(seeds):
+        path = os.path.join(input_dir, f"{int(seed):04d}.txt")
+        if not os.path.isfile(path):
+            continue
+        values = [v for v in scaling_bench.read_header_features(path) if v > 0]
+        sizes[k] = float(np.log(values).sum()) if values else 0.0
+    return sizes
+
+
+def strata(log_size: np.ndarray, spread: np.ndarray, size_bins: int) -> list:
+    """Index arrays of the strata: quantile bins of input size, each split by score spread when large enough."""
+    order = np.argsort(np.nan_to_num(log_size, nan=-np.inf), kind="stable")
+    groups = []
+    for size_group in np.array_split(order, max(1, min(size_bins, len(order)))):
+        if len(size_group) >= VARIANCE_SPLIT_MIN and np.ptp(spread[size_group]) > 0:
+            by_spread = size_group[np.argsort(spread[size_group], kind="stable")]
+            half = len(by_spread) // 2
+            groups.extend([by_spread[:half], by_spread[half:]])
+        elif len(size_group):
+            groups.append(size_group)
+    return groups
+
+
+def allocate(groups, spread: np.ndarray, count: int) -> np.ndarray:
+    """Seeds per stratum by Neyman allocation (stratum size x mean spread), rounded by largest remainder."""
+    sizes = np.array([len(g) for g in groups], dtype=np.float64)
+    weights = sizes * np.array([spread[g].mean() for g in groups])
+    if weights.sum() <= 0:
+        weights = sizes
+    alloc = np.zeros(len(groups), dtype=np.int64)
+    # 上限（層のシード数）に達した層を除きながら残りを配分する
+    while alloc.sum() < count:
+        open_mask = alloc < sizes
+        if not open_mask.any():
+            break
+        rest = count - alloc.sum()
+        w = np.where(open_mask, weights, 0.0)
+        if w.sum() <= 0:
+            w = np.where(open_mask, sizes, 0.0)
+        share = w / w.sum() * rest
+        add = np.minimum(np.floor(share).astype(np.int64), (sizes - alloc).astype(np.int64))
+        if add.sum() == 0:
+            add[int(np.argmax(np.where(open_mask, share - np.floor(share), -1.0)))] = 1
+        alloc += add
+    return alloc
+
+
+def select(log_size: np.ndarray, spread: np.ndarray, count: int, size_bins: int) -> np.ndarray:
+    """Indices of `count` seeds stratified by input size and score spread across solutions.
+
+    Within a stratum the seeds are taken evenly along the order of their spread,
+    so each stratum is covered from its least to its most discriminating seeds.
+    """
+    groups = strata(log_size, spread, size_bins)
+    picked = []
+    for group, n in zip(groups, allocate(groups, spread, min(count, len(log_size)))):
+        if n == 0:
+            continue
+        ordered = group[np.argsort(spread[group], kind="stable")]
+        positions = np.round((np.arange(n) + 0.5) * len(ordered) / n - 0.5).astype(np.int64)
+        picked.extend(ordered[positions])
+    return np.sort(np.array(picked, dtype=np.int64))
+
+
+def fidelity(rel: np.ndarray, subset: np.ndarray) -> float:
+    """Kendall tau between the ranking of the runs by mean relative score on subset and on all seeds."""
+    tau, _ = stats.kendalltau(rel[:, subset].mean(axis=1), rel.mean(axis=1))
+    return 1.0 if np.isnan(tau) else float(tau)
+
+
+def random_fidelity(rel: np.ndarray, count: int, draws: int, seed: int = 0) -> np.ndarray:
+    """fidelity() of `draws` uniformly random subsets of the same size (the baseline to beat)."""
+    rng = np.random.default_rng(seed)
+    n_seeds = rel.shape[1]
+    return np.array([fidelity(rel, rng.choice(n_seeds, size=count, replace=False)) for _ in range(draws)])
+
+
+def write_seeds_file(path: str, seeds, header_lines) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for line in header_lines:
+            f.write(f"# {line}\n")
+        for seed in seeds:
+            f.write(f"{int(seed)}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Choose a small representative seed subset from the run history.")
+    parser.add_argument("-n", "--count", type=int, default=20, help="Number of seeds to select.")
+    parser.add_argument("--runs", type=int, default=30, help="Latest distinct solutions in the history to use.")
+    parser.add_argument("--size-bins", type=int, default=4, help="Number of input-size strata.")
+    parser.add_argument("--draws", type=int, default=500, help="Random subsets drawn for the baseline fidelity.")
+    parser.add_argument("--output", default=None, help="Seeds file to write (default: [files] seeds_file).")
+    args = parser.parse_args()
+
+    config = config_util.load_config()
+    work_dir = config_util.work_dir()
+    objective = config["problem"]["objective"]
+    input_dir = os.path.join(work_dir, config["paths"]["testcase_input_dir"])
+
+    conn = history.connect(config)
+    run_ids = pick_runs(conn, max(1, args.runs))
+    if not run_ids:
+        print(f"Error: no runs in {history.db_path(config)} (run run_test.py first).", file=sys.stderr)
+        sys.exit(1)
+    seeds, rel = relative_matrix(conn, run_ids, objective)
+    conn.close()
+    count = min(max(1, args.count), len(seeds))
+    if count == 0:
+        print("Error: no seed was run by all of the selected runs.", file=sys.stderr)
+        sys.exit(1)
+
+    # 解の間でのスコアのばらつき（相対スコアの標準偏差）が大きいシードほど順位の判別に効く
+    spread = rel.std(axis=0)
+    log_size = log_sizes(input_dir, seeds)
+    subset = select(log_size, spread, count, max(1, args.size_bins))
+
+    header = [f"{len(subset)} of {len(seeds)} seeds from {len(run_ids)} runs (seed_select.py)"]
+    print(f"Selected {len(subset)} of {len(seeds)} seeds using {len(run_ids)} runs.")
+    if len(run_ids) >= 3:
+        tau = fidelity(rel, subset)
+        baseline = random_fidelity(rel, len(subset), max(1, args.draws))
+        lo, med = np.percentile(baseline, [5, 50])
+        print(f"Kendall tau vs all seeds: {tau:.3f}  (random subsets: median {med:.3f}, 5th percentile {lo:.3f})")
+        header.append(f"kendall tau vs all seeds: {tau:.3f} (random median {med:.3f})")
+    else:
+        print("Fidelity needs at least 3 runs of different solutions in the history; only input size was used.")
+    for k in subset:
+        size_str = f"{np.exp(log_size[k]):.3g}" if not np.isnan(log_size[k]) else "-"
+        print(f"  seed:{seeds[k]:04d}  size:{size_str}  spread:{spread[k]:.4f}")
+
+    output = os.path.join(work_dir, args.output or config_util.get_option(config, "files", "seeds_file", "seeds.txt"))
+    write_seeds_file(output, seeds[subset], header)
+    print(f"Saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,16 +13,20 @@ DEFAULT_CONFIG = {
         "testcase_input_dir": "in",                         # テストケースの入力ファイルがあるディレクトリ
         "testcase_output_dir": "out",                       # テストケースの出力ファイルを保存するディレクトリ
         "optuna_work_dir": "optuna_work",                   # Optuna 用の作業ディレクトリ
+        "build_cache_dir": "build_cache",                   # ビルド成果物のキャッシュディレクトリ
     },
     "files": {
         "cpp_file": "main.cpp",                             # メインのソースファイル
         "combined_file": "combined.cpp",                    # 結合後のソースファイル
+        "include_index_file": ".include_index.json",        # インクルードグラフとファイルハッシュのインデックス
         "sol_file": "solution",                             # コンパイルしたプログラムの名前
         "gen_file": "gen",                                  # テストケース生成プログラムの名前
         "vis_file": "vis",                                  # ビジュアライズプログラムの名前
         "tester_file": "tester",                            # テスタープログラムの名前
         "optuna_db_file": "optuna_study.db",                # Optuna 用のデータベースファイル
         "optuna_params_file": "params.json",                # Optuna 用パラメータ定義ファイル
+        "history_db_file": "history.db",                    # run_test.py の実行履歴を保存するデータベース
+        "seeds_file": "seeds.txt",                          # seed_select.py が選んだ代表シードの一覧
     },
     "problem": {
         "pretest_count": 150,                               # プレテストの数
@@ -31,6 +35,28 @@ DEFAULT_CONFIG = {
         "objective": "maximize",                            # 最大化 or 最小化
         "score_prefix": "Score =",                          # テスターの出力からスコアを取得するためのプレフィックス
     },
+    "build": {
+        "compiler": "g++",                                  # コンパイラ
+        "flags": "-O2",                                     # コンパイルオプション（空白区切り）
+        "pgo": False,                                       # 通常のビルドでも PGO を使うかどうか
+        "pgo_cases": 10,                                    # PGO のプロファイル収集に使うケース数（in/ の先頭から）
+    },
+    "runner": {
+        "time_measure": "wall",                             # TLE 判定に使う時間（wall: 経過時間, cpu: user+sys）
+        "memory_limit_mb": 0,                               # ソリューションのメモリ上限（RLIMIT_AS, 0 で無制限）
+    },
+    "scorer": {
+        "kind": "vis",                                      # 採点方法（vis / vis_batch / python / ctypes）
+        "path": "",                                         # python / ctypes の時の採点モジュール・共有ライブラリ
+    },
+    "optuna": {
+        "eval_cache": True,                                 # 同じパラメータ・シードの評価結果を再利用するか
+        "eval_cache_size": 200000,                          # 評価キャッシュの最大エントリ数（LRU で削除）
+        "storage": "sqlite",                                # sqlite / journal / memory / RDB の URL
+        "flush_interval_sec": 10.0,                         # storage = "memory" の時に SQLite へ書き戻す間隔（秒）
+        "mode": "single",                                   # single / constrained（実行時間を制約に）/ pareto（スコアと実行時間の 2 目的）
+        "tl_safety_ratio": 0.9,                             # params.json に反映する設定の最大実行時間の上限（TL に対する比率）
+    },
 }
 
 
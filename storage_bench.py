@@ -0,0 +1,87 @@
+import argparse
+import optuna
+import shutil
+import storage_util
+import tempfile
+import time
+import warnings
+from optuna.exceptions import ExperimentalWarning
+
+warnings.filterwarnings("ignore", category=ExperimentalWarning)
+optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+STUDY_NAME = "bench"
+
+
+def _objective(trial, n_params, n_reports):
+    # ストレージへの書き込み量だけを測るため、実際の評価はしない
+    xs = [trial.suggest_float(f"x{i}", 0.0, 1.0) for i in range(n_params)]
+    value = sum(xs)
+    for step in range(n_reports):
+        trial.report(value, step=step)
+        trial.should_prune()
+    return value
+
+
+def bench(kind, workers, n_trials, n_params, n_reports):
+    """(trials/s of the optimize loop, trials/s including the final flush, failed trials)."""
+    study_dir = tempfile.mkdtemp(prefix="storage_bench_")
+    try:
+        study, flusher = storage_util.open_study(
+            kind,
+            study_dir,
+            STUDY_NAME,
+            flush_interval=1.0,
+            direction="maximize",
+            pruner=optuna.pruners.NopPruner(),
+            sampler=optuna.samplers.RandomSampler(seed=0),
+        )
+        start = time.perf_counter()
+        try:
+            study.optimize(
+                lambda t: _objective(t, n_params, n_reports),
+                n_trials=n_trials,
+                n_jobs=workers,
+                catch=(Exception,),
+            )
+            optimize_elapsed = time.perf_counter() - start
+        finally:
+            if flusher is not None:
+                flusher.stop()
+        total_elapsed = time.perf_counter() - start
+        failed = len(study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.FAIL,)))
+        return n_trials / optimize_elapsed, n_trials / total_elapsed, failed
+    finally:
+        shutil.rmtree(study_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Optuna trial throughput per storage backend.")
+    parser.add_argument(
+        "--storages",
+        default=",".join(storage_util.STORAGE_KINDS),
+        help="Comma separated storage kinds (sqlite, journal, memory).",
+    )
+    parser.add_argument("--url", default=None, help="Also benchmark this RDB URL.")
+    parser.add_argument("--workers", default="1,2,4,8", help="Comma separated n_jobs values.")
+    parser.add_argument("--trials", type=int, default=200, help="Trials per measurement.")
+    parser.add_argument("--params", type=int, default=5, help="Parameters suggested per trial.")
+    parser.add_argument("--reports", type=int, default=50, help="Intermediate values reported per trial (instances).")
+    args = parser.parse_args()
+
+    kinds = [k for k in args.storages.split(",") if k]
+    if args.url:
+        kinds.append(args.url)
+    workers_list = [int(w) for w in args.workers.split(",")]
+
+    # trials/s: optimize ループ中のスループット, +flush: memory の最後の書き戻しまで含めたもの
+    print(f"{'storage':<12} {'workers':>7} {'trials/s':>10} {'+flush':>10} {'failed':>7}")
+    for kind in kinds:
+        for workers in workers_list:
+            label = "rdb" if "://" in kind else kind
+            throughput, total_throughput, failed = bench(kind, workers, args.trials, args.params, args.reports)
+            print(f"{label:<12} {workers:>7d} {throughput:>10.1f} {total_throughput:>10.1f} {failed:>7d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import optuna
+import os
+import threading
+from optuna.storages import InMemoryStorage, JournalStorage, RDBStorage
+
+try:
+    from optuna.storages.journal import JournalFileBackend
+except ImportError:  # optuna < 4.0
+    from optuna.storages import JournalFileStorage as JournalFileBackend
+
+JOURNAL_FILE = "optuna_journal.log"
+STORAGE_KINDS = ("sqlite", "journal", "memory")
+FINISHED_STATES = (
+    optuna.trial.TrialState.COMPLETE,
+    optuna.trial.TrialState.PRUNED,
+    optuna.trial.TrialState.FAIL,
+)
+
+
+def sqlite_storage(db_path: str) -> RDBStorage:
+    storage = RDBStorage(
+        url=f"sqlite:///{db_path}",
+        engine_kwargs={
+            "connect_args": {
+                # ロック待ちを最大20秒まで許容
+                "timeout": 20.0,
+            }
+        },
+    )
+    # URL のクエリ（mode=wal）は pysqlite では無視されるため、WAL は PRAGMA で有効にする（DB ファイルに保存される）
+    with storage.engine.connect() as conn:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+    return storage
+
+
+def journal_storage(path: str) -> JournalStorage:
+    return JournalStorage(JournalFileBackend(path))
+
+
+def create_storage(kind: str, study_dir: str, db_file: str):
+    """Persistent storage for a study directory.
+
+    kind: "sqlite" (db_file in study_dir), "journal" (append-only log file in
+    study_dir) or an RDB URL such as postgresql://... / mysql://...
+    ("memory" is handled by open_study).
+    """
+    if kind == "sqlite":
+        return sqlite_storage(os.path.join(study_dir, db_file))
+    if kind == "journal":
+        return journal_storage(os.path.join(study_dir, JOURNAL_FILE))
+    if "://" in kind:
+        return RDBStorage(url=kind)
+    raise ValueError(f"Unsupported storage: {kind}")
+
+
+def study_name(kind: str, study_dir: str, db_file: str) -> str:
+    """Name of the study of study_dir in its storage.
+
+    A shared RDB holds the studies of every directory, so there the directory name
+    is used; per-directory files (sqlite / journal / memory) keep db_file.
+    """
+    if "://" in kind:
+        return os.path.basename(os.path.normpath(study_dir))
+    return db_file
+
+
+def load_existing_study(study_dir: str, db_file: str, kind: str = "sqlite"):
+    """Study of a previous study directory, or None if it has none.
+
+    The journal or SQLite file in the directory is used if present, else the
+    study of the directory in the RDB given by kind (when it is a URL).
+    """
+    journal = os.path.join(study_dir, JOURNAL_FILE)
+    if os.path.isfile(journal):
+        return optuna.load_study(study_name=db_file, storage=journal_storage(journal))
+    db_path = os.path.join(study_dir, db_file)
+    if os.path.isfile(db_path):
+        return optuna.load_study(study_name=db_file, storage=sqlite_storage(db_path))
+    if "://" in kind:
+        try:
+            return optuna.load_study(study_name=study_name(kind, study_dir, db_file), storage=RDBStorage(url=kind))
+        except KeyError:
+            return None
+    return None
+
+
+class IntervalFlusher:
+    """Copy finished trials of an in-memory study to a persistent study every `interval` seconds."""
+
+    def __init__(self, src: optuna.Study, dst: optuna.Study, interval: float):
+        self.src = src
+        self.dst = dst
+        self.interval = interval
+        self._flushed = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def mark_flushed(self, numbers) -> None:
+        self._flushed.update(numbers)
+
+    def flush(self) -> int:
+        with self._lock:
+            trials = [
+                t for t in self.src.get_trials(deepcopy=False, states=FINISHED_STATES)
+                if t.number not in self._flushed
+            ]
+            if trials:
+                self.dst.add_trials(trials)
+                self._flushed.update(t.number for t in trials)
+            return len(trials)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+
+
+def open_study(kind: str, study_dir: str, db_file: str, flush_interval: float = 10.0, **create_kwargs):
+    """Create or load the study of study_dir on the given storage kind.
+
+    Returns (study, flusher). flusher is an IntervalFlusher for kind="memory"
+    (trials live in memory and are written to the SQLite DB in batches) and None
+    otherwise; call flusher.stop() when the optimization ends.
+    """
+    if kind != "memory":
+        storage = create_storage(kind, study_dir, db_file)
+        study = optuna.create_study(
+            study_name=study_name(kind, study_dir, db_file), storage=storage, load_if_exists=True, **create_kwargs
+        )
+        return study, None
+
+    persistent = optuna.create_study(
+        study_name=db_file,
+        storage=create_storage("sqlite", study_dir, db_file),
+        load_if_exists=True,
+        **{k: v for k, v in create_kwargs.items() if k in ("direction", "directions")},
+    )
+    study = optuna.create_study(storage=InMemoryStorage(), **create_kwargs)
+    # 既存の trial をメモリ側に読み込み（再開時）、書き戻し済みとして扱う
+    # メモリ側では trial 番号が 0 から振り直されるので、書き戻し済みの判定はメモリ側の番号で行う
+    existing = persistent.get_trials(deepcopy=False, states=FINISHED_STATES)
+    study.add_trials(existing)
+    flusher = IntervalFlusher(study, persistent, flush_interval)
+    flusher.mark_flushed(range(len(existing)))
+    flusher.start()
+    return study, flusher
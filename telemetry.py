@@ -0,0 +1,160 @@
+import json
+import math
+import sys
+import threading
+import time
+
+FLUSH_INTERVAL = 1.0  # イベントファイルを flush する最短間隔（秒）
+TTY_REFRESH = 0.5  # 端末での進捗表示の更新間隔（秒）
+LOG_REFRESH = 10.0  # 端末以外（ログファイル等）への進捗出力間隔（秒）
+
+
+def _json_default(obj):
+    # NumPy のスカラーなど
+    if hasattr(obj, "item"):
+        return obj.item()
+    return str(obj)
+
+
+class EventLog:
+    """Thread-safe JSON-lines event stream.
+
+    Each event is one line {"ts": unix time, "event": name, ...fields}. Events
+    are also passed to the attached views (e.g. ProgressView).
+    """
+
+    def __init__(self, path=None, views=()):
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._views = list(views)
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def emit(self, event: str, **fields) -> None:
+        record = {"ts": round(time.time(), 3), "event": event}
+        record.update(fields)
+        with self._lock:
+            if self._file is not None:
+                self._file.write(json.dumps(record, separators=(",", ":"), default=_json_default) + "\n")
+                # 毎回は flush せず、tail -f で追える程度の間隔でまとめて書き出す
+                now = time.monotonic()
+                if now - self._last_flush >= FLUSH_INTERVAL:
+                    self._file.flush()
+                    self._last_flush = now
+            for view in self._views:
+                view.update(record)
+
+    def close(self) -> None:
+        with self._lock:
+            for view in self._views:
+                view.close()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def create(path=None, view=None):
+    """EventLog writing to path and/or feeding view, or None if neither is requested."""
+    if path is None and view is None:
+        return None
+    return EventLog(path, views=[view] if view is not None else [])
+
+
+def _format_duration(sec: float) -> str:
+    if not math.isfinite(sec):
+        return "--:--"
+    sec = int(sec)
+    if sec >= 3600:
+        return f"{sec // 3600}:{sec % 3600 // 60:02d}:{sec % 60:02d}"
+    return f"{sec // 60:02d}:{sec % 60:02d}"
+
+
+class ProgressView:
+    """One-line progress display built from events.
+
+    unit="cases" (run_test.py): progress, cases/s, ETA, running mean score with
+    95% CI of the OK cases and the slowest case so far.
+    unit="trials" (optuna_manager.py): progress, trials/s, instances/s, ETA,
+    best value and pruned count.
+    """
+
+    def __init__(self, total: int, unit: str = "cases", direction: str = "maximize", stream=None):
+        self.total = total
+        self.unit = unit
+        self.direction = direction
+        self.stream = stream if stream is not None else sys.stderr
+        self.tty = self.stream.isatty()
+        self.refresh = TTY_REFRESH if self.tty else LOG_REFRESH
+        self.start = time.monotonic()
+        self._last_render = 0.0
+        self.cases = 0
+        self.trials = 0
+        self.pruned = 0
+        self.best = None
+        # Welford 法によるスコアの平均・分散（OK のケースのみ）
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.slowest = None  # (elapsed_ms, case)
+
+    def update(self, record: dict) -> None:
+        event = record["event"]
+        if event == "case_finished":
+            self.cases += 1
+            if record.get("status", "OK") == "OK" and record.get("score") is not None:
+                self.n += 1
+                delta = record["score"] - self.mean
+                self.mean += delta / self.n
+                self.m2 += delta * (record["score"] - self.mean)
+            elapsed = record.get("elapsed_ms")
+            if elapsed is not None and (self.slowest is None or elapsed > self.slowest[0]):
+                self.slowest = (elapsed, record.get("case"))
+        elif event in ("trial_completed", "trial_pruned"):
+            self.trials += 1
+            if event == "trial_pruned":
+                self.pruned += 1
+            value = record.get("value")
+            if event == "trial_completed" and value is not None:
+                if self.best is None or (value > self.best if self.direction == "maximize" else value < self.best):
+                    self.best = value
+        else:
+            return
+        now = time.monotonic()
+        if now - self._last_render >= self.refresh:
+            self._last_render = now
+            self._render(now)
+
+    def status_line(self, now: float) -> str:
+        elapsed = max(now - self.start, 1e-9)
+        done = self.cases if self.unit == "cases" else self.trials
+        rate = done / elapsed
+        eta = (self.total - done) / rate if rate > 0 else math.inf
+        parts = [f"[{done}/{self.total} {self.unit}]", f"{rate:.2f} {self.unit}/s"]
+        if self.unit == "trials":
+            parts.append(f"{self.cases / elapsed:.1f} cases/s")
+        parts.append(f"ETA {_format_duration(eta)}")
+        if self.unit == "cases":
+            if self.n > 0:
+                half = 1.96 * math.sqrt(self.m2 / (self.n - 1) / self.n) if self.n > 1 else 0.0
+                parts.append(f"mean {self.mean:,.1f} ±{half:,.1f}")
+            if self.slowest is not None:
+                parts.append(f"slowest {self.slowest[1]} ({self.slowest[0]:.0f} ms)")
+        else:
+            if self.best is not None:
+                parts.append(f"best {self.best:,.2f}")
+            parts.append(f"pruned {self.pruned}")
+        return "  ".join(parts)
+
+    def _render(self, now: float) -> None:
+        line = self.status_line(now)
+        if self.tty:
+            # 同じ行を上書きする
+            self.stream.write("\r" + line + "\x1b[K")
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def close(self) -> None:
+        self._render(time.monotonic())
+        if self.tty:
+            self.stream.write("\n")
+            self.stream.flush()